@@ -6,18 +6,28 @@ API для Telegram Mini App.
 import hashlib
 import hmac
 import json
+import logging
 import os
+import uuid
 from pathlib import Path
 from urllib.parse import parse_qsl
 
 from aiohttp import web
 
 import database as db
+from codes import codes
 from config import BOT_TOKEN
+from health import health
+from logs import dropped_records, request_id
+from loop_monitor import monitor
+from qr_generator import QRQueueFull
+from rotating import rotation
 
 # Путь к папке webapp
 WEBAPP_PATH = Path(__file__).parent / 'webapp'
 
+logger = logging.getLogger(__name__)
+
 
 def verify_telegram_data(init_data: str) -> dict | None:
     """
@@ -59,7 +69,7 @@ def verify_telegram_data(init_data: str) -> dict | None:
         
         return None
     except Exception as e:
-        print(f"Ошибка верификации: {e}")
+        logger.warning(f"Ошибка верификации: {e}")
         return None
 
 
@@ -123,6 +133,19 @@ async def handle_check_in(request: web.Request) -> web.Response:
             headers=headers
         )
     
+    # Повторный скан уже отмеченного — ответ из памяти, без запросов к БД
+    marked_day = await db.checked_in_day(user_id)
+    if marked_day is not None:
+        return web.json_response(
+            {
+                "success": True,
+                "already_marked": True,
+                "message": f"Вы уже отмечены на День {marked_day}!",
+                "day": marked_day
+            },
+            headers=headers
+        )
+    
     # Проверяем, зарегистрирован ли пользователь
     user = await db.get_user(user_id)
     if not user:
@@ -154,8 +177,9 @@ async def handle_check_in(request: web.Request) -> web.Response:
             headers=headers
         )
     
-    # Проверяем код
-    if code != active_day["code"].upper():
+    # Проверяем код (дня, зала или ротируемый, см. codes.py)
+    target = codes.check(code, active_day)
+    if target is None:
         return web.json_response(
             {"success": False, "error": "Неверный код"},
             status=400,
@@ -163,7 +187,7 @@ async def handle_check_in(request: web.Request) -> web.Response:
         )
     
     # Отмечаем посещение
-    await db.mark_attendance(user_id, active_day["day_number"])
+    await db.mark_attendance(user_id, active_day["day_number"], target.location)
     attendance = await db.get_user_attendance(user_id)
     
     return web.json_response(
@@ -203,9 +227,156 @@ async def handle_status(request: web.Request) -> web.Response:
         )
 
 
+# Экран с ротируемым QR-кодом для проектора/монитора.
+# Картинка обновляется ровно в момент смены окна — сервер сообщает,
+# сколько осталось до следующего кадра.
+DISPLAY_HTML = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>День {day}</title>
+<style>
+  html, body {{ margin: 0; height: 100%; background: #EAE0C7; color: #2E211B;
+               font-family: sans-serif; }}
+  body {{ display: flex; flex-direction: column; align-items: center;
+          justify-content: center; }}
+  h1 {{ font-size: 6vh; margin: 0 0 2vh; }}
+  img {{ height: 80vh; }}
+</style>
+</head>
+<body>
+<h1>День {day}</h1>
+<img id="qr" alt="QR-код">
+<script>
+  const url = "/display/{day}/frame?key={key}";
+  const img = document.getElementById("qr");
+  async function next() {{
+    let delay = 1000;
+    try {{
+      const response = await fetch(url + "&t=" + Date.now(), {{ cache: "no-store" }});
+      if (response.ok) {{
+        const old = img.src;
+        img.src = URL.createObjectURL(await response.blob());
+        if (old) URL.revokeObjectURL(old);
+        delay = parseFloat(response.headers.get("X-Next-Frame-In")) * 1000 + 100;
+      }}
+    }} catch (e) {{}}
+    setTimeout(next, delay);
+  }}
+  next();
+</script>
+</body>
+</html>
+"""
+
+
+def _display_day(request: web.Request) -> int | None:
+    """Номер дня экрана, если ключ верный и ротация включена."""
+    try:
+        day_number = int(request.match_info["day"])
+    except ValueError:
+        return None
+    key = request.query.get("key", "")
+    if not rotation.check_display_key(day_number, key) or not rotation.is_rotating(day_number):
+        return None
+    return day_number
+
+
+async def handle_display(request: web.Request) -> web.Response:
+    """
+    Экран с ротируемым QR-кодом дня.
+    GET /display/{day}?key=...
+    """
+    day_number = _display_day(request)
+    if day_number is None:
+        return web.Response(text="Not found", status=404)
+    
+    return web.Response(
+        text=DISPLAY_HTML.format(day=day_number, key=request.query["key"]),
+        content_type="text/html"
+    )
+
+
+async def handle_display_frame(request: web.Request) -> web.Response:
+    """
+    Текущий кадр ротируемого QR-кода.
+    GET /display/{day}/frame?key=...
+    """
+    day_number = _display_day(request)
+    if day_number is None:
+        return web.Response(text="Not found", status=404)
+    
+    try:
+        svg = await rotation.frame(day_number)
+    except QRQueueFull:
+        return web.Response(text="Busy", status=503, headers={"Retry-After": "1"})
+    
+    return web.Response(
+        body=svg,
+        content_type="image/svg+xml",
+        headers={
+            "Cache-Control": "no-store",
+            "X-Next-Frame-In": f"{rotation.seconds_left():.3f}",
+        }
+    )
+
+
+async def handle_healthz(request: web.Request) -> web.Response:
+    """
+    Процесс жив и event loop отвечает.
+    GET /healthz
+    """
+    return web.json_response({"status": "ok"})
+
+
+async def handle_readyz(request: web.Request) -> web.Response:
+    """
+    Готовность принимать трафик: последний результат проверок из кэша.
+    GET /readyz
+    """
+    result = health.readiness()
+    return web.json_response(result, status=200 if result["ready"] else 503)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """
+    Метрики в текстовом формате Prometheus.
+    GET /metrics
+    """
+    histogram = monitor.histogram()
+    lines = [
+        "# HELP event_loop_lag_seconds Задержка event loop.",
+        "# TYPE event_loop_lag_seconds histogram",
+    ]
+    for bound, count in histogram["buckets"]:
+        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+        lines.append(f'event_loop_lag_seconds_bucket{{le="{le}"}} {count}')
+    lines += [
+        f"event_loop_lag_seconds_sum {histogram['sum']:.6f}",
+        f"event_loop_lag_seconds_count {histogram['count']}",
+        "# HELP log_records_dropped_total Записи лога, отброшенные при переполнении очереди.",
+        "# TYPE log_records_dropped_total counter",
+        f"log_records_dropped_total {dropped_records()}",
+    ]
+    return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+
+@web.middleware
+async def request_id_middleware(request: web.Request, handler):
+    """request_id запроса для логов: из заголовка X-Request-ID или новый."""
+    rid = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex[:16]
+    token = request_id.set(rid)
+    try:
+        response = await handler(request)
+    finally:
+        request_id.reset(token)
+    response.headers["X-Request-ID"] = rid
+    return response
+
+
 def create_app() -> web.Application:
     """Создание веб-приложения."""
-    app = web.Application()
+    app = web.Application(middlewares=[request_id_middleware])
     
     # Главная страница
     app.router.add_get('/', handle_index)
@@ -213,6 +384,13 @@ def create_app() -> web.Application:
     # API эндпоинты
     app.router.add_route("*", "/api/check-in", handle_check_in)
     app.router.add_get("/api/status", handle_status)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", handle_healthz)
+    app.router.add_get("/readyz", handle_readyz)
+    
+    # Экран ротируемого QR-кода
+    app.router.add_get("/display/{day}", handle_display)
+    app.router.add_get("/display/{day}/frame", handle_display_frame)
     
     # Раздача статических файлов (CSS, JS, шрифты, картинки)
     if WEBAPP_PATH.exists():
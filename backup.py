@@ -0,0 +1,162 @@
+"""
+Резервные копии БД без остановки бота.
+
+Копия снимается через SQLite Online Backup API на отдельном соединении:
+по step_pages страниц за шаг с паузой между шагами, так что источник
+заблокирован лишь на время короткого шага и запись отметок не ждёт.
+sqlite3.backup синхронный, поэтому копирование идёт в отдельном потоке
+и event loop не занимает.
+
+Если во время копирования БД меняет другое соединение, SQLite начинает
+копию заново. Чтобы под нагрузкой копия всё же завершилась, после
+max_restarts перезапусков оставшееся копируется одним шагом.
+
+Готовая копия проверяется (PRAGMA integrity_check) и только потом
+получает имя database-<дата>.db; хранятся последние keep копий.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from config import BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_KEEP, DB_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class BackupError(Exception):
+    """Копия не снята или не прошла проверку целостности."""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class BackupManager:
+    """Резервные копии по расписанию и по запросу админа."""
+
+    def __init__(self, db_path: str, backup_dir: Path, interval: float, keep: int,
+                 step_pages: int = 64, step_sleep: float = 0.005, max_restarts: int = 20):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+
+        self._lock = asyncio.Lock()
+        # Выставляется в stop(): начатое копирование прерывается, новое не начинается
+        self._abort = threading.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        """Снимается ли копия прямо сейчас."""
+        return self._lock.locked()
+
+    # === Копирование (в отдельном потоке) ===
+
+    def _copy(self, target: Path) -> int:
+        """Скопировать БД в target и проверить копию. Возвращает число перезапусков."""
+        restarts = 0
+        last_remaining = None
+
+        def progress(status: int, remaining: int, total: int):
+            nonlocal restarts, last_remaining
+            if self._abort.is_set():
+                raise BackupError("копирование прервано остановкой бота")
+            # Удачный шаг без продвижения — источник изменился и SQLite начал копию заново
+            if status == sqlite3.SQLITE_OK and last_remaining is not None and remaining >= last_remaining:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise _TooManyRestarts
+            last_remaining = remaining
+            # Пауза между шагами: источник свободен для записи
+            if remaining:
+                time.sleep(self.step_sleep)
+
+        source = sqlite3.connect(self.db_path)
+        dest = sqlite3.connect(target)
+        try:
+            try:
+                source.backup(dest, pages=self.step_pages, progress=progress)
+            except _TooManyRestarts:
+                source.backup(dest)
+            result = dest.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                raise BackupError(f"копия не прошла проверку целостности: {result}")
+        finally:
+            dest.close()
+            source.close()
+        return restarts
+
+    def _rotate(self) -> None:
+        """Удалить старые копии сверх keep."""
+        backups = sorted(self.backup_dir.glob("database-*.db"))
+        for path in backups[:-self.keep] if self.keep > 0 else []:
+            path.unlink(missing_ok=True)
+
+    # === Снимок ===
+
+    async def snapshot(self) -> Path:
+        """Снять резервную копию сейчас. Возвращает путь к проверенной копии."""
+        if self._abort.is_set():
+            raise BackupError("бот останавливается, копия не снимается")
+        async with self._lock:
+            if self._abort.is_set():
+                raise BackupError("бот останавливается, копия не снимается")
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            # Микросекунды: копия по расписанию и /backup в одну секунду не совпадут
+            target = self.backup_dir / datetime.now().strftime("database-%Y%m%d-%H%M%S-%f.db")
+            part = target.with_name(target.name + ".part")
+            part.unlink(missing_ok=True)
+
+            started = time.monotonic()
+            try:
+                restarts = await asyncio.to_thread(self._copy, part)
+            except BaseException:
+                part.unlink(missing_ok=True)
+                raise
+            os.replace(part, target)
+            self._rotate()
+
+            logger.info(
+                f"Резервная копия {target.name}: {target.stat().st_size / 1024:.0f} КБ "
+                f"за {time.monotonic() - started:.2f} с, перезапусков: {restarts}"
+            )
+            return target
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot()
+            except Exception:
+                logger.exception("Не удалось снять резервную копию БД")
+
+    # === Запуск ===
+
+    def start(self) -> None:
+        self._abort.clear()
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="db-backup")
+
+    async def stop(self) -> None:
+        """
+        Остановить расписание (в начале остановки бота): начатое копирование
+        прерывается, новые копии до start() не снимаются.
+        """
+        self._abort.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+backups = BackupManager(DB_PATH, BACKUP_DIR, BACKUP_INTERVAL_HOURS * 60 * 60, BACKUP_KEEP)
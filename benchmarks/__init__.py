@@ -0,0 +1,7 @@
+"""
+Бенчмарки бота. Запуск из корня проекта:
+
+    python -m benchmarks.bench_qr_loop_lag
+    python -m benchmarks.bench_qr_backends
+    python -m benchmarks.bench_import_time
+"""
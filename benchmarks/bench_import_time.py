@@ -0,0 +1,70 @@
+"""
+Время импорта модулей бота (по данным python -X importtime).
+
+Каждый модуль импортируется в отдельном свежем процессе несколько раз,
+берём лучший результат. Кроме времени проверяем, что тяжёлые
+зависимости, нужные только админке (qrcode, PIL, openpyxl,
+multiprocessing), не подгружаются при старте бота и API.
+
+    python -m benchmarks.bench_import_time
+"""
+
+import subprocess
+import sys
+
+TARGETS = ["main", "api", "handlers.admin", "qr_generator", "export"]
+# Эти модули должны импортироваться только при первом использовании
+LAZY_MODULES = ["qrcode", "PIL", "openpyxl", "multiprocessing"]
+# Для каких целей проверяем, что LAZY_MODULES не подгружены
+STARTUP_TARGETS = ["main", "api"]
+RUNS = 3
+TOP = 5
+
+
+def import_profile(module: str) -> dict[str, tuple[int, int]]:
+    """Имя модуля -> (собственное время, суммарное время) в микросекундах."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def best_profile(module: str) -> dict[str, tuple[int, int]]:
+    profiles = [import_profile(module) for _ in range(RUNS)]
+    return min(profiles, key=lambda p: p[module][1])
+
+
+def main() -> int:
+    import_profile("main")  # прогрев .pyc
+
+    failed = False
+    for target in TARGETS:
+        profile = best_profile(target)
+        total = profile[target][1]
+        print(f"{target}: {total / 1000:.1f} мс, модулей: {len(profile)}")
+
+        heaviest = sorted(profile.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (self_us, _) in heaviest[:TOP]:
+            print(f"    {self_us / 1000:>7.1f} мс  {name}")
+
+        if target in STARTUP_TARGETS:
+            loaded = [name for name in LAZY_MODULES if name in profile]
+            if loaded:
+                print(f"    FAIL: при старте подгружаются {', '.join(loaded)}")
+                failed = True
+
+    if failed:
+        return 1
+    print("OK: тяжёлые зависимости подгружаются только при использовании")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Сравнение бэкендов рендера QR-кодов: время и размер результата.
+
+Рендерим одни и те же коды во всех стилях из qr_generator.STYLES
+и печатаем среднее время на картинку и средний размер в байтах
+относительно текущего стиля по умолчанию (StyledPilImage).
+
+    python -m benchmarks.bench_qr_backends
+"""
+
+import statistics
+import sys
+import time
+
+from qr_generator import DEFAULT_STYLE, STYLES, render_qr
+
+CODES = [f"ДЕНЬ{i}" for i in range(1, 6)] + ["R1-ABCDEFGHJK", "KOD-2024-FINAL"]
+ROUNDS = 5
+
+
+def measure(style: str) -> tuple[float, float]:
+    """Среднее время рендера (с) и средний размер (байт)."""
+    render_qr(CODES[0], 1, style)  # прогрев
+    timings = []
+    sizes = []
+    for _ in range(ROUNDS):
+        for day_number, code in enumerate(CODES, 1):
+            started = time.perf_counter()
+            data = render_qr(code, day_number, style)
+            timings.append(time.perf_counter() - started)
+            sizes.append(len(data))
+    return statistics.mean(timings), statistics.mean(sizes)
+
+
+def main() -> int:
+    results = {style: measure(style) for style in STYLES}
+    base_time, base_size = results[DEFAULT_STYLE]
+
+    print(f"{'стиль':>8} {'мс/QR':>8} {'байт':>8} {'быстрее':>8} {'меньше':>8}")
+    for style, (elapsed, size) in results.items():
+        print(
+            f"{style:>8} {elapsed * 1000:>8.2f} {size:>8.0f} "
+            f"{base_time / elapsed:>7.1f}x {base_size / size:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Задержка event loop во время рендера QR-кодов.
+
+Параллельно с рендером идут имитации отметок (короткие корутины каждые
+5 мс); меряем, на сколько они опаздывают. При синхронном рендере отметки
+ждут окончания каждой картинки, с generate_qr_code_async — нет.
+
+    python -m benchmarks.bench_qr_loop_lag
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+from qr_generator import generate_qr_code, generate_qr_code_async, shutdown_executor
+
+RENDERS = 10
+TICK = 0.005
+# Отметка не должна ждать дольше этого при асинхронном рендере
+MAX_ASYNC_DELAY = 0.05
+
+
+async def check_ins(stop: asyncio.Event, delays: list[float]):
+    """Имитация потока отметок: каждая должна начаться через TICK."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        delays.append(time.perf_counter() - started - TICK)
+
+
+async def measure(render) -> tuple[float, list[float]]:
+    delays: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(check_ins(stop, delays))
+    await asyncio.sleep(TICK * 4)
+
+    started = time.perf_counter()
+    for i in range(RENDERS):
+        await render(f"ДЕНЬ{i}", i)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    return elapsed, delays
+
+
+async def render_sync(code: str, day_number: int):
+    generate_qr_code(code, day_number)
+
+
+def report(name: str, elapsed: float, delays: list[float]) -> float:
+    delays = sorted(delays)
+    p99 = delays[int(len(delays) * 0.99) - 1] if len(delays) > 1 else delays[-1]
+    print(
+        f"{name:>6}: {RENDERS} QR за {elapsed:.2f} с, "
+        f"задержка отметок p50={statistics.median(delays) * 1000:.1f} мс "
+        f"p99={p99 * 1000:.1f} мс max={delays[-1] * 1000:.1f} мс"
+    )
+    return delays[-1]
+
+
+async def main() -> int:
+    generate_qr_code("прогрев", 0)
+    report("sync", *await measure(render_sync))
+    worst = report("async", *await measure(generate_qr_code_async))
+    shutdown_executor()
+
+    if worst > MAX_ASYNC_DELAY:
+        print(f"FAIL: задержка {worst * 1000:.1f} мс > {MAX_ASYNC_DELAY * 1000:.0f} мс")
+        return 1
+    print("OK: задержка отметок не зависит от рендера")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,523 @@
+"""
+Движок рассылок.
+
+Сообщения отправляет пул воркеров, общая скорость ограничена
+token bucket под лимит Telegram (~30 сообщений в секунду).
+RetryAfter и сетевые ошибки повторяются с backoff, заблокировавшие
+бота пользователи запоминаются и больше не получают рассылок.
+
+Задания хранятся в БД (broadcast_jobs / broadcast_recipients), поэтому
+после перезапуска рассылка продолжается с последнего сохранённого
+получателя. Статусы сохраняются пачками.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+
+import database as db
+from config import BROADCAST_RATE, BROADCAST_WORKERS, BROADCAST_PROGRESS_INTERVAL
+from keyboards import get_back_to_admin_kb, get_broadcast_control_kb
+
+logger = logging.getLogger(__name__)
+
+# Статусы доставки одному получателю
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity разом."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Остановить выдачу токенов (например, после RetryAfter)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    # Пауза — не время накопления: иначе сразу после неё
+                    # ушла бы полная пачка и Telegram снова ответил бы 429
+                    self._tokens = 0
+                    self._updated_at = time.monotonic()
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Общий лимит на все рассылки процесса
+limiter = TokenBucket(rate=BROADCAST_RATE)
+
+
+@dataclass
+class BroadcastStats:
+    """Счётчики рассылки."""
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+
+class BroadcastEngine:
+    """Рассылка текста списку пользователей пулом воркеров."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = BROADCAST_WORKERS,
+        max_attempts: int = 5,
+        bucket: TokenBucket = limiter,
+        on_result: Callable[[int, str], Awaitable[None]] | None = None,
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.bucket = bucket
+        self.on_result = on_result
+        self.stats = BroadcastStats()
+        self.cancelled = False
+        self._sending = 0
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+
+    async def send_one(self, user_id: int, text: str) -> str:
+        """Отправить сообщение одному пользователю, вернуть статус."""
+        delay = 1.0
+        for attempt in range(1, self.max_attempts + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(user_id, text)
+                return SENT
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать — тормозим всех отправителей
+                self.bucket.pause(e.retry_after)
+                logger.warning(f"RetryAfter {e.retry_after} с при рассылке")
+            except TelegramForbiddenError:
+                await db.mark_blocked(user_id)
+                return BLOCKED
+            except TelegramBadRequest as e:
+                logger.info(f"Не удалось отправить {user_id}: {e.message}")
+                return FAILED
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt == self.max_attempts:
+                    break
+                logger.info(f"Сетевая ошибка при отправке {user_id}: {e}, повтор через {delay} с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+        return FAILED
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    @property
+    def sending(self) -> int:
+        """Сколько сообщений отправляется прямо сейчас."""
+        return self._sending
+
+    def pause(self) -> None:
+        """Приостановить отправку (уже начатые сообщения дойдут)."""
+        self._resumed.clear()
+
+    def resume(self) -> None:
+        self._resumed.set()
+
+    def cancel(self) -> None:
+        """Остановить рассылку; неотправленные получатели остаются в очереди."""
+        self.cancelled = True
+        self._resumed.set()
+
+    async def _worker(self, queue: asyncio.Queue, text: str) -> None:
+        while True:
+            user_id = await queue.get()
+            try:
+                await self._resumed.wait()
+                if self.cancelled:
+                    continue
+                self._sending += 1
+                # Неожиданная ошибка отправки — тоже результат (failed), иначе
+                # получатель не станет обработанным и курсор задания встанет
+                status = FAILED
+                try:
+                    status = await self.send_one(user_id, text)
+                except Exception:
+                    logger.exception(f"Ошибка рассылки пользователю {user_id}")
+                finally:
+                    self._sending -= 1
+                if status == SENT:
+                    self.stats.sent += 1
+                elif status == BLOCKED:
+                    self.stats.blocked += 1
+                else:
+                    self.stats.failed += 1
+                if self.on_result is not None:
+                    await self.on_result(user_id, status)
+            except Exception:
+                logger.exception(f"Не удалось записать результат рассылки пользователю {user_id}")
+            finally:
+                queue.task_done()
+
+    async def run(
+        self,
+        recipients: AsyncIterable[int] | Iterable[int],
+        text: str,
+        stats: BroadcastStats | None = None,
+    ) -> BroadcastStats:
+        """Разослать text всем получателям и дождаться завершения."""
+        self.stats = stats or BroadcastStats()
+        count_total = not self.stats.total
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, text))
+            for _ in range(self.workers)
+        ]
+        try:
+            async for user_id in _iterate(recipients):
+                await self._resumed.wait()
+                if self.cancelled:
+                    break
+                await queue.put(user_id)
+                if count_total:
+                    self.stats.total += 1
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.stats
+
+
+async def _iterate(items: AsyncIterable[int] | Iterable[int]) -> AsyncIterator[int]:
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {seconds} с"
+    return f"{seconds} с"
+
+
+class ProgressReporter:
+    """
+    Обновляет сообщение с прогрессом рассылки не чаще раза в interval секунд
+    и только если цифры изменились, поэтому число правок не зависит
+    от количества получателей.
+    """
+
+    def __init__(self, bot: Bot, job_id: int, chat_id: int, message_id: int,
+                 engine: BroadcastEngine, interval: float = BROADCAST_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.job_id = job_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.engine = engine
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._last_shown: tuple | None = None
+        self._baseline: tuple[float, int] | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    def render(self) -> str:
+        stats = self.engine.stats
+        now = time.monotonic()
+        if self._baseline is None:
+            # Скорость считаем только по этому запуску (задание могло продолжиться)
+            self._baseline = (now, stats.done)
+        started_at, done_before = self._baseline
+        elapsed = now - started_at
+        rate = (stats.done - done_before) / elapsed if elapsed > 0 else 0.0
+        remaining = max(stats.total - stats.done, 0)
+        eta = format_duration(remaining / rate) if rate > 0 else "—"
+
+        title = "⏸ Рассылка приостановлена" if self.engine.paused else "⏳ Отправка рассылки..."
+        return (
+            f"{title}\n\n"
+            f"Прогресс: {stats.done}/{stats.total}\n"
+            f"📤 Отправлено: {stats.sent}\n"
+            f"❌ Не доставлено: {stats.failed + stats.blocked}\n"
+            f"⚡ Скорость: {rate:.1f} сообщ./с\n"
+            f"⏱ Осталось: {eta}"
+        )
+
+    async def update(self) -> None:
+        stats = self.engine.stats
+        shown = (stats.sent, stats.failed, stats.blocked, self.engine.paused)
+        if shown == self._last_shown:
+            return
+        try:
+            await self.bot.edit_message_text(
+                self.render(),
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                reply_markup=get_broadcast_control_kb(self.job_id, paused=self.engine.paused)
+            )
+            self._last_shown = shown
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest:
+            # "message is not modified" и подобное — просто пропускаем
+            self._last_shown = shown
+
+    async def _loop(self) -> None:
+        self.render()  # фиксируем точку отсчёта скорости
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.update()
+            except Exception:
+                logger.exception(f"Не удалось обновить прогресс рассылки {self.job_id}")
+
+
+class BroadcastJob:
+    """Выполнение одного сохранённого задания рассылки."""
+
+    def __init__(self, bot: Bot, job: dict, batch_size: int = 200, commit_interval: float = 2.0):
+        self.bot = bot
+        self.job_id = job['job_id']
+        self.text = job['text']
+        self.chat_id = job['chat_id']
+        self.message_id = job['message_id']
+        self.cursor = job['cursor']
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.engine = BroadcastEngine(bot, on_result=self._on_result)
+
+        self._results: list[tuple[int, str]] = []
+        # Выданные воркерам получатели по порядку — для курсора
+        self._dispatched: deque[int] = deque()
+        self._completed: set[int] = set()
+        self._last_commit = time.monotonic()
+        self._commit_lock = asyncio.Lock()
+
+    async def _recipients(self) -> AsyncIterator[int]:
+        """Неотправленные получатели порциями по ключу user_id."""
+        after = self.cursor
+        while True:
+            batch = await db.get_pending_recipients(self.job_id, after)
+            if not batch:
+                return
+            for user_id in batch:
+                self._dispatched.append(user_id)
+                yield user_id
+            after = batch[-1]
+
+    async def _on_result(self, user_id: int, status: str) -> None:
+        # Сначала отмечаем получателя обработанным: если commit упадёт,
+        # статус останется в буфере, а курсор не застрянет на нём
+        self._results.append((user_id, status))
+        self._completed.add(user_id)
+        if (len(self._results) >= self.batch_size
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            await self.commit()
+
+    async def commit(self) -> None:
+        """Сохранить накопленные статусы и сдвинуть курсор."""
+        async with self._commit_lock:
+            # Курсор — последний получатель, до которого включительно всё обработано
+            cursor = self.cursor
+            advanced = 0
+            for user_id in self._dispatched:
+                if user_id not in self._completed:
+                    break
+                cursor = user_id
+                advanced += 1
+            results = self._results[:]
+            self._last_commit = time.monotonic()
+            if results:
+                await db.save_broadcast_results(self.job_id, results, cursor)
+            # Состояние меняем только после сохранения: если запись упала,
+            # пачка сохранится при следующем commit
+            del self._results[:len(results)]
+            for _ in range(advanced):
+                self._completed.discard(self._dispatched.popleft())
+            self.cursor = cursor
+
+    async def run(self) -> BroadcastStats:
+        counts = await db.get_broadcast_counts(self.job_id)
+        stats = BroadcastStats(
+            total=sum(counts.values()),
+            sent=counts.get(SENT, 0),
+            failed=counts.get(FAILED, 0),
+            blocked=counts.get(BLOCKED, 0)
+        )
+        progress = ProgressReporter(
+            self.bot, self.job_id, self.chat_id, self.message_id, self.engine
+        )
+        self.engine.stats = stats
+        progress.start()
+        try:
+            stats = await self.engine.run(self._recipients(), self.text, stats)
+        finally:
+            await progress.stop()
+            # При остановке процесса статус остаётся running — задание продолжится
+            await asyncio.shield(self.commit())
+
+        status = "cancelled" if self.engine.cancelled else "done"
+        await db.set_broadcast_status(self.job_id, status)
+        await self.report(stats)
+        return stats
+
+    async def report(self, stats: BroadcastStats) -> None:
+        """Итоговое сообщение админу."""
+        title = "⏹ <b>Рассылка отменена</b>" if self.engine.cancelled else "✅ <b>Рассылка завершена!</b>"
+        try:
+            await self.bot.edit_message_text(
+                f"{title}\n\n"
+                f"📤 Отправлено: {stats.sent}\n"
+                f"❌ Не доставлено: {stats.failed}\n"
+                f"🚫 Заблокировали бота: {stats.blocked}",
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                parse_mode="HTML",
+                reply_markup=get_back_to_admin_kb()
+            )
+        except TelegramBadRequest as e:
+            logger.info(f"Не удалось обновить сообщение рассылки {self.job_id}: {e.message}")
+
+
+class BroadcastManager:
+    """Запуск, пауза, продолжение и отмена заданий рассылки."""
+
+    def __init__(self):
+        self.jobs: dict[int, BroadcastJob] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def _launch(self, bot: Bot, job: dict) -> BroadcastJob:
+        runner = BroadcastJob(bot, job)
+        self.jobs[runner.job_id] = runner
+        task = asyncio.create_task(self._run(runner))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return runner
+
+    async def _run(self, runner: BroadcastJob) -> None:
+        try:
+            await runner.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Рассылка {runner.job_id} прервана")
+        finally:
+            self.jobs.pop(runner.job_id, None)
+
+    async def start(self, bot: Bot, text: str, chat_id: int, message_id: int) -> tuple[int, int]:
+        """Создать задание и запустить его в фоне. Возвращает (job_id, total)."""
+        job_id, total = await db.create_broadcast_job(text, chat_id, message_id)
+        self._launch(bot, await db.get_broadcast_job(job_id))
+        return job_id, total
+
+    async def resume_unfinished(self, bot: Bot) -> int:
+        """Продолжить задания, прерванные перезапуском."""
+        jobs = await db.get_broadcast_jobs("running")
+        for job in jobs:
+            logger.info(f"Продолжаем рассылку {job['job_id']} с получателя {job['cursor']}")
+            self._launch(bot, job)
+        return len(jobs)
+
+    async def pause(self, job_id: int) -> bool:
+        runner = self.jobs.get(job_id)
+        if runner is None:
+            return False
+        runner.engine.pause()
+        await db.set_broadcast_status(job_id, "paused")
+        return True
+
+    async def resume(self, bot: Bot, job_id: int) -> bool:
+        runner = self.jobs.get(job_id)
+        if runner is not None:
+            runner.engine.resume()
+        else:
+            # Задание было на паузе во время перезапуска
+            job = await db.get_broadcast_job(job_id)
+            if not job or job['status'] != "paused":
+                return False
+            self._launch(bot, job)
+        await db.set_broadcast_status(job_id, "running")
+        return True
+
+    async def shutdown(self, timeout: float) -> None:
+        """
+        Остановка процесса: новые сообщения не отправляются, начатые
+        дожидаются, затем задания прерываются с сохранением прогресса.
+        Статус остаётся running — после перезапуска рассылки продолжатся.
+        """
+        if not self.tasks:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for runner in self.jobs.values():
+            runner.engine.pause()
+        while (any(runner.engine.sending for runner in self.jobs.values())
+               and loop.time() < deadline):
+            await asyncio.sleep(0.05)
+
+        tasks = set(self.tasks)
+        for task in tasks:
+            task.cancel()
+        # Отменённое задание ещё сохраняет прогресс (см. BroadcastJob.run)
+        await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 1.0))
+
+    async def cancel(self, job_id: int) -> bool:
+        runner = self.jobs.get(job_id)
+        if runner is not None:
+            runner.engine.cancel()
+            return True
+        job = await db.get_broadcast_job(job_id)
+        if not job or job['status'] != "paused":
+            return False
+        await db.set_broadcast_status(job_id, "cancelled")
+        return True
+
+
+manager = BroadcastManager()
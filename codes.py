@@ -0,0 +1,132 @@
+"""
+Коды для отметки.
+
+Кроме основного кода дня (event_days.code) у дня могут быть
+дополнительные коды — по одному на зал, если сессии идут параллельно
+(таблица day_codes). Отметка по коду зала запоминает место.
+
+Все статичные коды держатся в памяти в словаре
+нормализованный код -> (день, место), так что проверка кода — один
+поиск в словаре, сколько бы кодов ни было. Словарь перечитывается
+при периодической сверке с БД (см. db.checked_in_day), так что коды,
+изменённые другим процессом, подхватываются без перезапуска.
+
+Ротируемые токены проверяет rotation (см. rotating.py); для дня
+с ротацией статичные коды не принимаются.
+"""
+
+import logging
+from dataclasses import dataclass
+
+import database as db
+from rotating import rotation
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CodeTarget:
+    """Куда ведёт код: день и место (None — основной код дня)."""
+    day_number: int
+    location: str | None = None
+
+
+def normalize(code: str) -> str:
+    """Код в том виде, в каком его сравниваем (без пробелов, заглавными)."""
+    return code.strip().upper()
+
+
+class CodeIndex:
+    """Словарь всех статичных кодов: код -> день и место."""
+
+    def __init__(self):
+        self._codes: dict[str, CodeTarget] = {}
+        # Растёт при каждом изменении словаря в этом процессе
+        self._version = 0
+
+    async def load(self) -> None:
+        """Загрузить коды дней и залов из БД (при старте и после изменений)."""
+        version = self._version
+        codes = {}
+        for row in await db.get_day_codes():
+            codes[normalize(row['code'])] = CodeTarget(row['day_number'], row['location'])
+        # Основной код дня важнее кода зала с тем же текстом
+        for day in await db.get_all_days():
+            codes[normalize(day['code'])] = CodeTarget(day['day_number'])
+        # Пока читали, код добавили или удалили — прочитанное уже устарело
+        if version == self._version:
+            self._codes = codes
+
+    async def reload(self) -> None:
+        """Перечитать коды при сверке с БД; ошибка не мешает отметке."""
+        try:
+            await self.load()
+        except Exception:
+            logger.exception("Не удалось перечитать коды из БД")
+
+    # === Проверка ===
+
+    def resolve(self, code: str) -> CodeTarget | None:
+        """День и место, к которым ведёт код, или None."""
+        code = normalize(code)
+        day_number = rotation.validate(code)
+        if day_number is not None:
+            return CodeTarget(day_number)
+        target = self._codes.get(code)
+        if target is None or rotation.is_rotating(target.day_number):
+            return None
+        return target
+
+    def check(self, code: str, day: dict) -> CodeTarget | None:
+        """Цель кода, если он подходит к дню (обычно — к активному)."""
+        target = self.resolve(code)
+        if target is None and normalize(code) == normalize(day['code']):
+            # День мог открыть другой процесс — основной код сверяем с записью дня
+            if not rotation.is_rotating(day['day_number']):
+                target = CodeTarget(day['day_number'])
+        if target is None or target.day_number != day['day_number']:
+            return None
+        return target
+
+    # === Изменение ===
+
+    def is_taken(self, code: str, day_number: int | None = None) -> bool:
+        """Занят ли код (основным кодом другого дня или кодом зала)."""
+        target = self._codes.get(normalize(code))
+        if target is None:
+            return False
+        return not (target.location is None and target.day_number == day_number)
+
+    async def open_day(self, day_number: int, code: str) -> bool:
+        """Открыть день с основным кодом (см. db.create_day)."""
+        if self.is_taken(code, day_number):
+            return False
+        if not await db.create_day(day_number, code):
+            return False
+        self._version += 1
+        await self.load()
+        return True
+
+    async def add(self, code: str, day_number: int, location: str) -> bool:
+        """Добавить код зала. False, если такой код уже есть."""
+        if self.is_taken(code):
+            return False
+        if not await db.add_day_code(normalize(code), day_number, location):
+            return False
+        self._codes[normalize(code)] = CodeTarget(day_number, location)
+        self._version += 1
+        return True
+
+    async def remove(self, code: str) -> bool:
+        """Удалить код зала. False, если такого кода зала нет."""
+        target = self._codes.get(normalize(code))
+        if target is None or target.location is None:
+            return False
+        await db.delete_day_code(normalize(code))
+        del self._codes[normalize(code)]
+        self._version += 1
+        return True
+
+
+codes = CodeIndex()
+db.on_sync(codes.reload)
@@ -15,7 +15,62 @@ WEBAPP_URL = os.getenv("WEBAPP_URL", "")
 API_PORT = int(os.getenv("API_PORT", "8080"))
 API_URL = os.getenv("API_URL", "")  # Публичный URL API (например https://api.example.com)
 
+# Параллельная обработка апдейтов (0 — стандартный режим aiogram)
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", "32"))
+UPDATES_QUEUE_LIMIT = int(os.getenv("UPDATES_QUEUE_LIMIT", "1000"))
+
+# Антифлуд: окно схлопывания повторов и время жизни кэша экранов (в секундах)
+ANTIFLOOD_WINDOW = float(os.getenv("ANTIFLOOD_WINDOW", "1.0"))
+ANTIFLOOD_REPLY_TTL = float(os.getenv("ANTIFLOOD_REPLY_TTL", "5.0"))
+
+# Рассылки: сообщений в секунду (лимит Telegram ~30) и число параллельных отправителей
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "28"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+
+# Рендер QR-кодов: "thread" или "process", число воркеров и предел очереди
+QR_EXECUTOR = os.getenv("QR_EXECUTOR", "thread")
+QR_WORKERS = int(os.getenv("QR_WORKERS", "2"))
+QR_QUEUE_LIMIT = int(os.getenv("QR_QUEUE_LIMIT", "20"))
+
+# FSM-хранилище: размер кэша и время жизни брошенных состояний (в часах)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_STATE_TTL_HOURS = float(os.getenv("FSM_STATE_TTL_HOURS", "24"))
+
+# Ротируемые QR-коды: период смены (в секундах) и секрет для HMAC
+# (по умолчанию выводится из токена бота)
+QR_ROTATION_SECONDS = int(os.getenv("QR_ROTATION_SECONDS", "30"))
+QR_ROTATION_SECRET = os.getenv("QR_ROTATION_SECRET", "")
+
+# Логи: уровень, формат ("text" или "json") и размер очереди записей
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# uvloop вместо стандартного event loop (если установлен: pip install uvloop)
+USE_UVLOOP = os.getenv("USE_UVLOOP", "false").lower() in ("1", "true", "yes")
+
+# Мониторинг задержки event loop: период замера (с) и порог предупреждения (мс)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+# Проверки готовности (/readyz): период (с) и допустимая задержка записи в БД (мс)
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "5"))
+HEALTH_DB_MAX_LATENCY_MS = float(os.getenv("HEALTH_DB_MAX_LATENCY_MS", "1000"))
+
+# Как часто сверять отметки активного дня в памяти с БД (в секундах)
+CHECKIN_SYNC_INTERVAL = float(os.getenv("CHECKIN_SYNC_INTERVAL", "30"))
+
+# Сколько секунд ждать завершения начатой работы при остановке (SIGTERM)
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+
 # Путь к БД: в Docker используем /app/data, локально - текущую папку
 DATA_DIR = Path(os.getenv("DATA_DIR", "."))
 DATA_DIR.mkdir(exist_ok=True)
 DB_PATH = str(DATA_DIR / "database.db")
+
+# Резервные копии БД: период (в часах, 0 — только по команде /backup)
+# и сколько последних копий хранить
+BACKUP_DIR = DATA_DIR / "backups"
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
@@ -1,5 +1,62 @@
+import asyncio
+import sqlite3
+import time
+from typing import Awaitable, Callable, Iterator
+
 import aiosqlite
-from config import DB_PATH
+from config import DB_PATH, CHECKIN_SYNC_INTERVAL
+
+
+# Подписчики на новые отметки (сбрасывают свои кэши по user_id)
+_attendance_listeners: list[Callable[[int], None]] = []
+
+
+def on_attendance_marked(callback: Callable[[int], None]):
+    """Зарегистрировать обработчик, вызываемый после новой отметки."""
+    _attendance_listeners.append(callback)
+    return callback
+
+
+# Подписчики на периодическую сверку с БД (см. checked_in_day): перечитывают
+# то, что мог изменить другой процесс
+_sync_listeners: list[Callable[[], Awaitable[None]]] = []
+
+
+def on_sync(callback: Callable[[], Awaitable[None]]):
+    """Зарегистрировать корутину, вызываемую при периодической сверке с БД."""
+    _sync_listeners.append(callback)
+    return callback
+
+
+# Версия данных: растёт при каждом изменении участников, дней и отметок.
+# По ней кэши понимают, что отрендеренный экран устарел.
+_data_version = 0
+
+
+def get_data_version() -> int:
+    """Текущая версия данных."""
+    return _data_version
+
+
+def _bump_data_version():
+    global _data_version
+    _data_version += 1
+
+
+# Отметки активного дня в памяти: повторный скан уже отмеченного
+# участника отвечает без SQL. Множество загружается при открытии дня
+# и пополняется в mark_attendance. Раз в CHECKIN_SYNC_INTERVAL секунд
+# сверяемся с БД — день и отметки могла изменить другая копия бота.
+_active_day: int | None = None
+_checked_in: set[int] = set()
+_checked_in_synced = 0.0
+# Отметки (user_id, день), сделанные пока идут загрузки, — свой буфер
+# у каждой загрузки, чтобы их не потерять
+_checked_in_loading: list[set[tuple[int, int]]] = []
+# Номер последней начатой загрузки: результат более старой отбрасывается
+_checked_in_generation = 0
+# Сверку выполняет один запрос, остальные ждут её результата
+_checked_in_sync_lock = asyncio.Lock()
 
 
 async def init_db():
@@ -34,15 +91,238 @@ async def init_db():
                 user_id INTEGER NOT NULL,
                 day_number INTEGER NOT NULL,
                 marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                location TEXT,
                 FOREIGN KEY (user_id) REFERENCES users(user_id),
                 FOREIGN KEY (day_number) REFERENCES event_days(day_number),
                 UNIQUE(user_id, day_number)
             )
         """)
         
+        # Место отметки (код зала, см. codes.py) в базах, созданных до него
+        async with db.execute("PRAGMA table_info(attendance)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "location" not in columns:
+            await db.execute("ALTER TABLE attendance ADD COLUMN location TEXT")
+        
+        # Дополнительные коды дня — по одному на зал (см. codes.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS day_codes (
+                code TEXT PRIMARY KEY,
+                day_number INTEGER NOT NULL,
+                location TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Индексы для постраничного списка участников
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_name ON users(last_name, first_name)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_group_name ON users(group_name, last_name, first_name)"
+        )
+        
+        # Полнотекстовый поиск участников (FTS5 поверх users, синхронизируется триггерами)
+        async with db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'users_fts'"
+        ) as cursor:
+            fts_exists = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                last_name, first_name, patronymic, group_name,
+                content='users', content_rowid='user_id',
+                tokenize='unicode61'
+            )
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+                INSERT INTO users_fts(rowid, last_name, first_name, patronymic, group_name)
+                VALUES (new.user_id, new.last_name, new.first_name, new.patronymic, new.group_name);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+                INSERT INTO users_fts(users_fts, rowid, last_name, first_name, patronymic, group_name)
+                VALUES ('delete', old.user_id, old.last_name, old.first_name, old.patronymic, old.group_name);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE ON users BEGIN
+                INSERT INTO users_fts(users_fts, rowid, last_name, first_name, patronymic, group_name)
+                VALUES ('delete', old.user_id, old.last_name, old.first_name, old.patronymic, old.group_name);
+                INSERT INTO users_fts(rowid, last_name, first_name, patronymic, group_name)
+                VALUES (new.user_id, new.last_name, new.first_name, new.patronymic, new.group_name);
+            END
+        """)
+        if not fts_exists:
+            # Индексируем участников, зарегистрированных до появления поиска
+            await db.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+        
+        # Сводка по группам: ведётся триггерами, чтение не зависит от числа участников
+        async with db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'group_stats'"
+        ) as cursor:
+            rollup_exists = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS group_stats (
+                group_name TEXT PRIMARY KEY,
+                participants INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS group_day_stats (
+                group_name TEXT NOT NULL,
+                day_number INTEGER NOT NULL,
+                attendees INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_name, day_number)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS group_stats_user_insert AFTER INSERT ON users BEGIN
+                INSERT INTO group_stats (group_name, participants) VALUES (new.group_name, 1)
+                ON CONFLICT(group_name) DO UPDATE SET participants = participants + 1;
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS group_stats_user_delete AFTER DELETE ON users BEGIN
+                UPDATE group_stats SET participants = participants - 1
+                WHERE group_name = old.group_name;
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS group_stats_user_update AFTER UPDATE OF group_name ON users
+            WHEN old.group_name IS NOT new.group_name BEGIN
+                UPDATE group_stats SET participants = participants - 1
+                WHERE group_name = old.group_name;
+                INSERT INTO group_stats (group_name, participants) VALUES (new.group_name, 1)
+                ON CONFLICT(group_name) DO UPDATE SET participants = participants + 1;
+                UPDATE group_day_stats SET attendees = attendees - 1
+                WHERE group_name = old.group_name
+                  AND day_number IN (SELECT day_number FROM attendance WHERE user_id = new.user_id);
+                INSERT INTO group_day_stats (group_name, day_number, attendees)
+                SELECT new.group_name, day_number, 1 FROM attendance WHERE user_id = new.user_id
+                ON CONFLICT(group_name, day_number) DO UPDATE SET attendees = attendees + 1;
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS group_stats_attendance_insert AFTER INSERT ON attendance BEGIN
+                INSERT INTO group_day_stats (group_name, day_number, attendees)
+                SELECT group_name, new.day_number, 1 FROM users WHERE user_id = new.user_id
+                ON CONFLICT(group_name, day_number) DO UPDATE SET attendees = attendees + 1;
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS group_stats_attendance_delete AFTER DELETE ON attendance BEGIN
+                UPDATE group_day_stats SET attendees = attendees - 1
+                WHERE day_number = old.day_number
+                  AND group_name = (SELECT group_name FROM users WHERE user_id = old.user_id);
+            END
+        """)
+        if not rollup_exists:
+            # Заполняем сводку по уже накопленным данным
+            await db.execute("""
+                INSERT INTO group_stats (group_name, participants)
+                SELECT group_name, COUNT(*) FROM users GROUP BY group_name
+            """)
+            await db.execute("""
+                INSERT INTO group_day_stats (group_name, day_number, attendees)
+                SELECT u.group_name, a.day_number, COUNT(*)
+                FROM attendance a JOIN users u ON u.user_id = a.user_id
+                GROUP BY u.group_name, a.day_number
+            """)
+        
+        # Пользователи, заблокировавшие бота (не получают рассылок)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_users (
+                user_id INTEGER PRIMARY KEY,
+                blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Задания рассылки и статусы по получателям (см. broadcast.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                chat_id INTEGER,
+                message_id INTEGER,
+                cursor INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                PRIMARY KEY (job_id, user_id),
+                FOREIGN KEY (job_id) REFERENCES broadcast_jobs(job_id)
+            ) WITHOUT ROWID
+        """)
+        
+        # file_id загруженных в Telegram QR-кодов (см. qr_cache.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS qr_files (
+                day_number INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                style TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                PRIMARY KEY (day_number, code, style)
+            )
+        """)
+        
+        # Дни с ротируемым QR-кодом (см. rotating.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS rotating_days (
+                day_number INTEGER PRIMARY KEY
+            )
+        """)
+        
+        # Пробная запись для проверки готовности (см. health.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS health_probe (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                checked_at REAL NOT NULL
+            )
+        """)
+        
+        # Состояния FSM (см. storage.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage(updated_at)"
+        )
+        
+        await db.commit()
+
+
+async def probe_write():
+    """Пробная запись: проверяет, что БД доступна на запись (см. health.py)."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            """INSERT INTO health_probe (id, checked_at) VALUES (1, julianday('now'))
+               ON CONFLICT(id) DO UPDATE SET checked_at = excluded.checked_at"""
+        )
         await db.commit()
 
 
+async def checkpoint():
+    """
+    Перенести журнал WAL в основной файл БД (при остановке бота).
+    В режиме обычного журнала ничего не делает.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
 # === Работа с пользователями ===
 
 async def add_user(user_id: int, first_name: str, last_name: str, 
@@ -56,9 +336,11 @@ async def add_user(user_id: int, first_name: str, last_name: str,
                 (user_id, first_name, last_name, patronymic, group_name)
             )
             await db.commit()
-            return True
         except aiosqlite.IntegrityError:
             return False
+    
+    _bump_data_version()
+    return True
 
 
 async def get_user(user_id: int) -> dict | None:
@@ -72,6 +354,27 @@ async def get_user(user_id: int) -> dict | None:
             return dict(row) if row else None
 
 
+async def get_user_with_attendance(user_id: int) -> dict | None:
+    """Получить пользователя вместе с днями посещения одним запросом."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """SELECT u.*, GROUP_CONCAT(a.day_number) AS attended_days
+               FROM users u
+               LEFT JOIN attendance a ON a.user_id = u.user_id
+               WHERE u.user_id = ?
+               GROUP BY u.user_id""",
+            (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            if not row:
+                return None
+            user = dict(row)
+            attended = user.pop('attended_days')
+            user['attendance'] = sorted(map(int, attended.split(','))) if attended else []
+            return user
+
+
 async def get_all_users() -> list[dict]:
     """Получить всех пользователей."""
     async with aiosqlite.connect(DB_PATH) as db:
@@ -81,14 +384,142 @@ async def get_all_users() -> list[dict]:
             return [dict(row) for row in rows]
 
 
+async def get_users_count() -> int:
+    """Число зарегистрированных участников."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute("SELECT COUNT(*) FROM users") as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+
+
+async def get_users_page(after_id: int | None = None, before_id: int | None = None,
+                         group_name: str | None = None, limit: int = 20) -> list[dict]:
+    """
+    Страница участников по алфавиту (keyset-пагинация).
+    
+    after_id / before_id — последний / первый участник соседней страницы:
+    запрос читает по индексу только limit строк, без OFFSET.
+    """
+    conditions = []
+    params: list = []
+    if group_name is not None:
+        conditions.append("u.group_name = ?")
+        params.append(group_name)
+    
+    order = "ASC"
+    if after_id is not None:
+        conditions.append(
+            "(u.last_name, u.first_name, u.user_id) > "
+            "(SELECT last_name, first_name, user_id FROM users WHERE user_id = ?)"
+        )
+        params.append(after_id)
+    elif before_id is not None:
+        conditions.append(
+            "(u.last_name, u.first_name, u.user_id) < "
+            "(SELECT last_name, first_name, user_id FROM users WHERE user_id = ?)"
+        )
+        params.append(before_id)
+        order = "DESC"
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT 
+            u.user_id,
+            u.last_name,
+            u.first_name,
+            u.patronymic,
+            u.group_name,
+            (SELECT COUNT(*) FROM attendance a WHERE a.user_id = u.user_id) as total_days
+        FROM users u
+        {where}
+        ORDER BY u.last_name {order}, u.first_name {order}, u.user_id {order}
+        LIMIT ?
+    """
+    params.append(limit)
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(query, params) as cursor:
+            rows = [dict(row) for row in await cursor.fetchall()]
+    
+    if order == "DESC":
+        rows.reverse()
+    return rows
+
+
+def _fts_query(text: str) -> str:
+    """Запрос FTS5: каждое слово — префикс, все слова обязательны."""
+    words = text.replace('"', ' ').split()
+    return " ".join(f'"{word}"*' for word in words)
+
+
+async def search_users(text: str, limit: int = 20) -> list[dict]:
+    """Поиск участников по ФИО и группе (префиксный, через FTS5)."""
+    query = _fts_query(text)
+    if not query:
+        return []
+    
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """SELECT 
+                   u.user_id,
+                   u.last_name,
+                   u.first_name,
+                   u.patronymic,
+                   u.group_name,
+                   (SELECT GROUP_CONCAT(day_number) FROM attendance a
+                    WHERE a.user_id = u.user_id) as attended_days
+               FROM users_fts
+               JOIN users u ON u.user_id = users_fts.rowid
+               WHERE users_fts MATCH ?
+               ORDER BY users_fts.rank
+               LIMIT ?""",
+            (query, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+
+async def get_groups() -> list[dict]:
+    """Список групп с числом участников."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            """SELECT group_name, COUNT(*) as users
+               FROM users GROUP BY group_name ORDER BY group_name"""
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+
 async def get_all_user_ids() -> list[int]:
-    """Получить ID всех пользователей для рассылки."""
+    """Получить ID всех пользователей для рассылки (кроме заблокировавших бота)."""
     async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT user_id FROM users") as cursor:
+        async with db.execute(
+            """SELECT user_id FROM users
+               WHERE user_id NOT IN (SELECT user_id FROM blocked_users)"""
+        ) as cursor:
             rows = await cursor.fetchall()
             return [row[0] for row in rows]
 
 
+async def mark_blocked(user_id: int):
+    """Запомнить, что пользователь заблокировал бота."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            "INSERT OR IGNORE INTO blocked_users (user_id) VALUES (?)", (user_id,)
+        )
+        await db.commit()
+
+
+async def unmark_blocked(user_id: int):
+    """Пользователь снова пишет боту — возвращаем его в рассылки."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("DELETE FROM blocked_users WHERE user_id = ?", (user_id,))
+        await db.commit()
+
+
 # === Работа с днями мероприятия ===
 
 async def create_day(day_number: int, code: str) -> bool:
@@ -104,10 +535,18 @@ async def create_day(day_number: int, code: str) -> bool:
                    ON CONFLICT(day_number) DO UPDATE SET code = ?, is_active = 1""",
                 (day_number, code, code)
             )
+            # QR-коды со старым кодом дня больше не нужны
+            await db.execute(
+                "DELETE FROM qr_files WHERE day_number = ? AND code != ?",
+                (day_number, code)
+            )
             await db.commit()
-            return True
         except aiosqlite.IntegrityError:
             return False
+    
+    _bump_data_version()
+    await load_checked_in()
+    return True
 
 
 async def get_active_day() -> dict | None:
@@ -126,6 +565,9 @@ async def deactivate_all_days():
     async with aiosqlite.connect(DB_PATH) as db:
         await db.execute("UPDATE event_days SET is_active = 0")
         await db.commit()
+    
+    _bump_data_version()
+    await load_checked_in()
 
 
 async def get_all_days() -> list[dict]:
@@ -139,31 +581,193 @@ async def get_all_days() -> list[dict]:
             return [dict(row) for row in rows]
 
 
+async def get_qr_file_id(day_number: int, code: str, style: str) -> str | None:
+    """Получить file_id ранее отправленного QR-кода."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT file_id FROM qr_files WHERE day_number = ? AND code = ? AND style = ?",
+            (day_number, code, style)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+
+async def save_qr_file_id(day_number: int, code: str, style: str, file_id: str | None):
+    """Запомнить (или забыть, если file_id=None) file_id QR-кода."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        if file_id is None:
+            await db.execute(
+                "DELETE FROM qr_files WHERE day_number = ? AND code = ? AND style = ?",
+                (day_number, code, style)
+            )
+        else:
+            await db.execute(
+                """INSERT INTO qr_files (day_number, code, style, file_id)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(day_number, code, style) DO UPDATE SET file_id = excluded.file_id""",
+                (day_number, code, style, file_id)
+            )
+        await db.commit()
+
+
+async def get_rotating_days() -> list[int]:
+    """Номера дней, для которых включён ротируемый QR-код."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute("SELECT day_number FROM rotating_days") as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+async def set_day_rotating(day_number: int, enabled: bool):
+    """Включить или выключить ротацию QR-кода для дня."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        if enabled:
+            await db.execute(
+                "INSERT OR IGNORE INTO rotating_days (day_number) VALUES (?)", (day_number,)
+            )
+        else:
+            await db.execute("DELETE FROM rotating_days WHERE day_number = ?", (day_number,))
+        await db.commit()
+
+
+async def get_day_codes() -> list[dict]:
+    """Коды залов всех дней."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT code, day_number, location FROM day_codes ORDER BY day_number, location"
+        ) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+
+async def add_day_code(code: str, day_number: int, location: str) -> bool:
+    """Добавить код зала. False, если такой код уже есть."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        try:
+            await db.execute(
+                "INSERT INTO day_codes (code, day_number, location) VALUES (?, ?, ?)",
+                (code, day_number, location)
+            )
+            await db.commit()
+        except aiosqlite.IntegrityError:
+            return False
+    return True
+
+
+async def delete_day_code(code: str):
+    """Удалить код зала."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("DELETE FROM day_codes WHERE code = ?", (code,))
+        await db.commit()
+
+
 # === Работа с посещениями ===
 
-async def mark_attendance(user_id: int, day_number: int) -> bool:
-    """Отметить посещение."""
+async def mark_attendance(user_id: int, day_number: int, location: str | None = None) -> bool:
+    """Отметить посещение (location — зал, если отметились по коду зала)."""
     async with aiosqlite.connect(DB_PATH) as db:
         try:
             await db.execute(
-                """INSERT INTO attendance (user_id, day_number)
-                   VALUES (?, ?)""",
-                (user_id, day_number)
+                """INSERT INTO attendance (user_id, day_number, location)
+                   VALUES (?, ?, ?)""",
+                (user_id, day_number, location)
             )
             await db.commit()
-            return True
         except aiosqlite.IntegrityError:
+            # Уже отмечен (возможно, другой копией бота)
+            _remember_checked_in(user_id, day_number)
             return False
+    
+    _remember_checked_in(user_id, day_number)
+    _bump_data_version()
+    for callback in _attendance_listeners:
+        callback(user_id)
+    return True
 
 
 async def check_attendance(user_id: int, day_number: int) -> bool:
     """Проверить, отмечен ли пользователь в этот день."""
+    if day_number == _active_day and user_id in _checked_in:
+        return True
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute(
             "SELECT 1 FROM attendance WHERE user_id = ? AND day_number = ?",
             (user_id, day_number)
         ) as cursor:
-            return await cursor.fetchone() is not None
+            marked = await cursor.fetchone() is not None
+    if marked:
+        _remember_checked_in(user_id, day_number)
+    return marked
+
+
+def _remember_checked_in(user_id: int, day_number: int):
+    for marked in _checked_in_loading:
+        marked.add((user_id, day_number))
+    if day_number == _active_day:
+        _checked_in.add(user_id)
+
+
+async def load_checked_in():
+    """Загрузить активный день и отмеченных в нём участников в память."""
+    global _active_day, _checked_in, _checked_in_synced, _checked_in_generation
+    _checked_in_generation += 1
+    generation = _checked_in_generation
+    marked: set[tuple[int, int]] = set()
+    _checked_in_loading.append(marked)
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            async with db.execute(
+                "SELECT day_number FROM event_days WHERE is_active = 1"
+            ) as cursor:
+                row = await cursor.fetchone()
+            day_number = row[0] if row else None
+            checked_in = set()
+            if day_number is not None:
+                async with db.execute(
+                    "SELECT user_id FROM attendance WHERE day_number = ?", (day_number,)
+                ) as cursor:
+                    checked_in = {row[0] for row in await cursor.fetchall()}
+        # Пока читали, началась другая загрузка — её снимок новее
+        if generation != _checked_in_generation:
+            return
+        checked_in |= {user_id for user_id, day in marked if day == day_number}
+        _active_day, _checked_in = day_number, checked_in
+        _checked_in_synced = time.monotonic()
+    finally:
+        _checked_in_loading.remove(marked)
+
+
+async def sync_checked_in():
+    """Сверить отметки в памяти с БД и перезагрузить, если разошлись."""
+    global _checked_in_synced
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            """SELECT ed.day_number, (SELECT COUNT(*) FROM attendance a
+                                       WHERE a.day_number = ed.day_number)
+               FROM event_days ed WHERE ed.is_active = 1"""
+        ) as cursor:
+            row = await cursor.fetchone()
+    day_number, count = row if row else (None, 0)
+    if day_number != _active_day or count != len(_checked_in):
+        await load_checked_in()
+    else:
+        _checked_in_synced = time.monotonic()
+
+
+async def checked_in_day(user_id: int) -> int | None:
+    """
+    Номер активного дня, если пользователь в нём уже отмечен.
+    Отвечает из памяти; к БД обращается только для периодической сверки.
+    """
+    if time.monotonic() - _checked_in_synced > CHECKIN_SYNC_INTERVAL:
+        async with _checked_in_sync_lock:
+            # Пока ждали, сверку мог выполнить другой запрос
+            if time.monotonic() - _checked_in_synced > CHECKIN_SYNC_INTERVAL:
+                await sync_checked_in()
+                for callback in _sync_listeners:
+                    await callback()
+    if _active_day is not None and user_id in _checked_in:
+        return _active_day
+    return None
 
 
 async def get_user_attendance(user_id: int) -> list[int]:
@@ -177,29 +781,80 @@ async def get_user_attendance(user_id: int) -> list[int]:
             return [row[0] for row in rows]
 
 
+# Участники с днями посещения (общий запрос для отчётов и экспорта)
+ATTENDANCE_STATS_QUERY = """
+    SELECT 
+        u.user_id,
+        u.last_name,
+        u.first_name,
+        u.patronymic,
+        u.group_name,
+        GROUP_CONCAT(a.day_number) as attended_days,
+        COUNT(a.day_number) as total_days
+    FROM users u
+    LEFT JOIN attendance a ON u.user_id = a.user_id
+    GROUP BY u.user_id
+    ORDER BY u.last_name, u.first_name
+"""
+
+
 async def get_attendance_stats() -> list[dict]:
     """Получить статистику посещений для экспорта."""
     async with aiosqlite.connect(DB_PATH) as db:
         db.row_factory = aiosqlite.Row
-        query = """
-            SELECT 
-                u.user_id,
-                u.last_name,
-                u.first_name,
-                u.patronymic,
-                u.group_name,
-                GROUP_CONCAT(a.day_number) as attended_days,
-                COUNT(a.day_number) as total_days
-            FROM users u
-            LEFT JOIN attendance a ON u.user_id = a.user_id
-            GROUP BY u.user_id
-            ORDER BY u.last_name, u.first_name
-        """
-        async with db.execute(query) as cursor:
+        async with db.execute(ATTENDANCE_STATS_QUERY) as cursor:
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
 
+def iter_attendance_stats(db_path: str = DB_PATH) -> Iterator[sqlite3.Row]:
+    """
+    Построчно отдаёт статистику посещений (синхронно, для фоновых потоков).
+    Строки не накапливаются в памяти.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        yield from conn.execute(ATTENDANCE_STATS_QUERY)
+    finally:
+        conn.close()
+
+
+async def get_group_stats() -> list[dict]:
+    """
+    Статистика по группам из сводных таблиц.
+    
+    Для каждой группы: participants, days ({день: пришло}) и rate —
+    доля посещений от возможных за все открытые дни.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute("SELECT COUNT(*) FROM event_days") as cursor:
+            days_count = (await cursor.fetchone())[0]
+        async with db.execute(
+            """SELECT g.group_name, g.participants, d.day_number, d.attendees
+               FROM group_stats g
+               LEFT JOIN group_day_stats d ON d.group_name = g.group_name
+               WHERE g.participants > 0
+               ORDER BY g.group_name, d.day_number"""
+        ) as cursor:
+            rows = await cursor.fetchall()
+    
+    groups: dict[str, dict] = {}
+    for group_name, participants, day_number, attendees in rows:
+        group = groups.setdefault(group_name, {
+            'group_name': group_name,
+            'participants': participants,
+            'days': {},
+        })
+        if day_number is not None:
+            group['days'][day_number] = attendees
+    
+    for group in groups.values():
+        possible = group['participants'] * days_count
+        group['rate'] = sum(group['days'].values()) / possible if possible else 0.0
+    return list(groups.values())
+
+
 async def get_day_stats() -> list[dict]:
     """Получить статистику по дням."""
     async with aiosqlite.connect(DB_PATH) as db:
@@ -219,3 +874,110 @@ async def get_day_stats() -> list[dict]:
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
+
+async def get_location_stats(day_number: int) -> dict[str | None, int]:
+    """Число отметок дня по залам (None — по основному коду дня)."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT location, COUNT(*) FROM attendance WHERE day_number = ? GROUP BY location",
+            (day_number,)
+        ) as cursor:
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
+
+
+# === Задания рассылки ===
+
+async def create_broadcast_job(text: str, chat_id: int, message_id: int) -> tuple[int, int]:
+    """Создать задание рассылки со списком получателей. Возвращает (job_id, total)."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            """INSERT INTO broadcast_jobs (text, chat_id, message_id)
+               VALUES (?, ?, ?)""",
+            (text, chat_id, message_id)
+        )
+        job_id = cursor.lastrowid
+        cursor = await db.execute(
+            """INSERT INTO broadcast_recipients (job_id, user_id)
+               SELECT ?, user_id FROM users
+               WHERE user_id NOT IN (SELECT user_id FROM blocked_users)""",
+            (job_id,)
+        )
+        total = cursor.rowcount
+        await db.commit()
+        return job_id, total
+
+
+async def get_broadcast_job(job_id: int) -> dict | None:
+    """Получить задание рассылки."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT * FROM broadcast_jobs WHERE job_id = ?", (job_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+async def get_broadcast_jobs(status: str) -> list[dict]:
+    """Получить задания рассылки с указанным статусом."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT * FROM broadcast_jobs WHERE status = ? ORDER BY job_id", (status,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+
+async def set_broadcast_status(job_id: int, status: str):
+    """Изменить статус задания рассылки."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        finished = status in ("done", "cancelled")
+        await db.execute(
+            """UPDATE broadcast_jobs
+               SET status = ?, finished_at = CASE WHEN ? THEN CURRENT_TIMESTAMP END
+               WHERE job_id = ?""",
+            (status, finished, job_id)
+        )
+        await db.commit()
+
+
+async def get_broadcast_counts(job_id: int) -> dict[str, int]:
+    """Число получателей задания по статусам."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            """SELECT status, COUNT(*) FROM broadcast_recipients
+               WHERE job_id = ? GROUP BY status""",
+            (job_id,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return {row[0]: row[1] for row in rows}
+
+
+async def get_pending_recipients(job_id: int, after: int, limit: int = 1000) -> list[int]:
+    """Следующая порция неотправленных получателей после курсора."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            """SELECT user_id FROM broadcast_recipients
+               WHERE job_id = ? AND user_id > ? AND status = 'pending'
+               ORDER BY user_id LIMIT ?""",
+            (job_id, after, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+
+async def save_broadcast_results(job_id: int, results: list[tuple[int, str]], cursor: int):
+    """Сохранить пачку статусов доставки и сдвинуть курсор одной транзакцией."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.executemany(
+            """UPDATE broadcast_recipients SET status = ?
+               WHERE job_id = ? AND user_id = ?""",
+            [(status, job_id, user_id) for user_id, status in results]
+        )
+        await db.execute(
+            "UPDATE broadcast_jobs SET cursor = MAX(cursor, ?) WHERE job_id = ?",
+            (cursor, job_id)
+        )
+        await db.commit()
@@ -0,0 +1,152 @@
+"""
+Диспетчер с ограниченной параллельной обработкой апдейтов.
+
+Апдейты разных пользователей обрабатываются параллельно (не больше
+заданного лимита), а апдейты одного пользователя — строго по очереди,
+чтобы переходы FSM (регистрация, ввод кода) не перемешивались.
+
+При остановке polling принятые апдейты дорабатываются (не дольше
+shutdown_timeout) до того, как aiogram закроет FSM-хранилище.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Hashable
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrentDispatcher(Dispatcher):
+    """Dispatcher с пулом обработчиков и очередями по пользователям."""
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int = 32,
+        max_queued: int = 1000,
+        shutdown_timeout: float = 10.0,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.shutdown_timeout = shutdown_timeout
+        self._workers = asyncio.Semaphore(max_concurrency)
+        # Ограничение на общее число принятых апдейтов: при переполнении
+        # polling ждёт, пока очередь разгрузится
+        self._slots = asyncio.Semaphore(max_concurrency + max_queued)
+        self._queues: dict[Hashable, deque] = {}
+        self._chains: set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._queued = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько апдейтов обрабатывается прямо сейчас."""
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        """Сколько апдейтов ждут своей очереди."""
+        return self._queued
+
+    def stats(self) -> dict:
+        """Счётчики нагрузки диспетчера."""
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "users": len(self._queues),
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def start_polling(self, *bots: Bot, **kwargs: Any) -> None:
+        # Апдейты принимаются последовательно, параллельность даёт _process_update
+        kwargs["handle_as_tasks"] = False
+        await super().start_polling(*bots, **kwargs)
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Дождаться обработки уже принятых апдейтов.
+        Что не успело за timeout, отменяется. Возвращает True, если успели всё.
+        """
+        chains = set(self._chains)
+        try:
+            if chains:
+                await asyncio.wait(chains, timeout=timeout)
+        finally:
+            pending = [task for task in chains if not task.done()]
+            for task in pending:
+                task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        return not pending
+
+    async def emit_shutdown(self, *args: Any, **kwargs: Any) -> None:
+        # Polling уже остановлен, новых апдейтов не будет. Дорабатываем
+        # принятые, и только потом aiogram закрывает FSM-хранилище
+        queued = self._in_flight + self._queued
+        if queued:
+            logger.info(f"Дорабатываем принятые апдейты: {queued}")
+        if not await self.drain(self.shutdown_timeout):
+            logger.warning("Не все апдейты обработаны до остановки")
+        await super().emit_shutdown(*args, **kwargs)
+
+    @staticmethod
+    def _ordering_key(update: Update) -> Hashable:
+        """Ключ упорядочивания: пользователь, иначе чат, иначе сам апдейт."""
+        context = UserContextMiddleware.resolve_event_context(update)
+        if context.user_id is not None:
+            return ("user", context.user_id)
+        if context.chat_id is not None:
+            return ("chat", context.chat_id)
+        return ("update", update.update_id)
+
+    async def _process_update(
+        self, bot: Bot, update: Update, call_answer: bool = True, **kwargs: Any
+    ) -> bool:
+        """Ставит апдейт в очередь пользователя и сразу возвращает управление."""
+        await self._slots.acquire()
+
+        key = self._ordering_key(update)
+        job = (bot, update, call_answer, kwargs)
+        self._queued += 1
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Для пользователя уже идёт обработка — встаём в конец его очереди
+            queue.append(job)
+            return True
+
+        self._queues[key] = deque([job])
+        task = asyncio.create_task(self._run_chain(key))
+        self._chains.add(task)
+        task.add_done_callback(self._chains.discard)
+        return True
+
+    async def _run_chain(self, key: Hashable) -> None:
+        """Обрабатывает апдейты одного пользователя по порядку."""
+        queue = self._queues[key]
+        try:
+            while queue:
+                async with self._workers:
+                    bot, update, call_answer, kwargs = queue.popleft()
+                    self._queued -= 1
+                    self._in_flight += 1
+                    try:
+                        await super()._process_update(
+                            bot=bot, update=update, call_answer=call_answer, **kwargs
+                        )
+                    finally:
+                        self._in_flight -= 1
+                        self._slots.release()
+        finally:
+            # Если цепочку отменили, оставшиеся апдейты больше не ждут
+            self._queued -= len(queue)
+            for _ in range(len(queue)):
+                self._slots.release()
+            del self._queues[key]
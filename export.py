@@ -0,0 +1,89 @@
+"""
+Экспорт посещаемости в CSV/XLSX.
+
+Файл пишется построчно в отдельном потоке, чтобы не блокировать
+event loop и не держать всех участников в памяти.
+openpyxl импортируется только при первом XLSX-экспорте.
+"""
+
+import asyncio
+import csv
+import os
+import tempfile
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Iterator
+
+import database as db
+
+# XLSX-экспорт необязателен
+XLSX_AVAILABLE = find_spec("openpyxl") is not None
+
+# С этих символов табличный редактор начинает формулу
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _safe_cell(value: str) -> str:
+    """Введённый пользователем текст, который Excel не примет за формулу."""
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _rows(days: list[int]) -> Iterator[list]:
+    """Заголовок и строки отчёта: по колонке на каждый день."""
+    yield ["№", "Фамилия", "Имя", "Отчество", "Группа", *(f"День {d}" for d in days), "Всего"]
+    for i, user in enumerate(db.iter_attendance_stats(), 1):
+        attended = set(
+            map(int, user['attended_days'].split(','))
+            if user['attended_days'] else []
+        )
+        yield [
+            i,
+            _safe_cell(user['last_name']),
+            _safe_cell(user['first_name']),
+            _safe_cell(user['patronymic'] or ""),
+            _safe_cell(user['group_name']),
+            *("+" if d in attended else "" for d in days),
+            user['total_days'],
+        ]
+
+
+def write_csv(path: Path, days: list[int]) -> None:
+    # utf-8-sig и ";" — чтобы Excel открывал кириллицу без настроек
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerows(_rows(days))
+
+
+def write_xlsx(path: Path, days: list[int]) -> None:
+    import openpyxl
+    
+    # write_only-режим не держит лист в памяти
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Посещаемость")
+    for row in _rows(days):
+        sheet.append(row)
+    workbook.save(path)
+
+
+async def export_attendance(fmt: str = "csv") -> Path:
+    """
+    Сформировать файл отчёта во временной папке.
+    Удалить файл после отправки — забота вызывающего.
+    """
+    if fmt == "xlsx" and not XLSX_AVAILABLE:
+        raise RuntimeError("Для XLSX-экспорта установите openpyxl")
+    writer = write_xlsx if fmt == "xlsx" else write_csv
+
+    days = [day['day_number'] for day in await db.get_all_days()] or list(range(1, 6))
+
+    fd, name = tempfile.mkstemp(prefix="attendance_", suffix=f".{fmt}")
+    os.close(fd)
+    path = Path(name)
+    try:
+        await asyncio.to_thread(writer, path, days)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
@@ -1,17 +1,29 @@
 import asyncio
+from html import escape
+from typing import Awaitable, Callable
+
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, BufferedInputFile, FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 import database as db
+from backup import backups
+from broadcast import manager as broadcasts
+from codes import codes
 from config import ADMIN_IDS
+from export import XLSX_AVAILABLE, export_attendance
 from keyboards import (
     get_admin_menu, get_day_selection_kb, get_back_to_admin_kb,
-    get_cancel_broadcast_kb, get_confirm_broadcast_kb, get_qr_day_selection_kb
+    get_cancel_broadcast_kb, get_confirm_broadcast_kb, get_qr_day_selection_kb,
+    get_broadcast_control_kb, get_report_kb, get_users_page_kb, get_groups_kb,
+    get_group_stats_kb, get_qr_rotation_kb
 )
-from qr_generator import generate_qr_code
+from qr_cache import DEFAULT_STYLE, qr_cache
+from qr_generator import QRQueueFull, build_qr_pdf, generate_qr_code_async, generate_qr_codes_bulk
+from rotating import rotation
 
 router = Router()
 
@@ -27,6 +39,38 @@ def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 
+# === Кэш экранов админки ===
+
+# Ключ экрана -> (версия данных, текст). Экран перерисовывается,
+# только если с прошлого раза данные менялись (см. db.get_data_version)
+_screen_cache: dict[str, tuple[int, str]] = {}
+
+
+async def cached_screen(key: str, render: Callable[[], Awaitable[str]]) -> str:
+    """Текст экрана из кэша или заново отрендеренный."""
+    version = db.get_data_version()
+    cached = _screen_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    
+    text = await render()
+    _screen_cache[key] = (version, text)
+    return text
+
+
+async def render_admin_panel() -> str:
+    active_day = await db.get_active_day()
+    status = f"🟢 Активен День {active_day['day_number']} (код: {active_day['code']})" if active_day else "🔴 Нет активного дня"
+    
+    users_count = await db.get_users_count()
+    
+    return (
+        f"🔧 <b>Админ-панель</b>\n\n"
+        f"📊 Всего участников: {users_count}\n"
+        f"📅 Статус: {status}"
+    )
+
+
 @router.message(Command("admin"))
 async def cmd_admin(message: Message, state: FSMContext):
     """Админ-панель."""
@@ -35,15 +79,9 @@ async def cmd_admin(message: Message, state: FSMContext):
         return
     
     await state.clear()
-    active_day = await db.get_active_day()
-    status = f"🟢 Активен День {active_day['day_number']} (код: {active_day['code']})" if active_day else "🔴 Нет активного дня"
-    
-    users = await db.get_all_users()
     
     await message.answer(
-        f"🔧 <b>Админ-панель</b>\n\n"
-        f"📊 Всего участников: {len(users)}\n"
-        f"📅 Статус: {status}",
+        await cached_screen("panel", render_admin_panel),
         parse_mode="HTML",
         reply_markup=get_admin_menu()
     )
@@ -57,15 +95,9 @@ async def admin_back(callback: CallbackQuery, state: FSMContext):
         return
     
     await state.clear()
-    active_day = await db.get_active_day()
-    status = f"🟢 Активен День {active_day['day_number']} (код: {active_day['code']})" if active_day else "🔴 Нет активного дня"
-    
-    users = await db.get_all_users()
     
     await callback.message.edit_text(
-        f"🔧 <b>Админ-панель</b>\n\n"
-        f"📊 Всего участников: {len(users)}\n"
-        f"📅 Статус: {status}",
+        await cached_screen("panel", render_admin_panel),
         parse_mode="HTML",
         reply_markup=get_admin_menu()
     )
@@ -142,7 +174,9 @@ async def process_day_code(message: Message, state: FSMContext):
         await message.answer("❌ Ошибка. Начните заново через /admin")
         return
     
-    await db.create_day(day_number, code)
+    if not await codes.open_day(day_number, code):
+        await message.answer("❌ Такой код уже используется. Введите другой:")
+        return
     await state.clear()
     
     await message.answer(
@@ -177,6 +211,108 @@ async def close_day(callback: CallbackQuery):
     await callback.answer("День закрыт!")
 
 
+# === Резервная копия ===
+
+@router.message(Command("backup"))
+async def cmd_backup(message: Message):
+    """Снять резервную копию БД сейчас."""
+    if not is_admin(message.from_user.id):
+        return
+    
+    if backups.running:
+        await message.answer("⏳ Резервная копия уже снимается, подождите минуту.")
+        return
+    
+    status = await message.answer("⏳ Снимаю резервную копию БД...")
+    try:
+        path = await backups.snapshot()
+    except Exception as e:
+        await status.edit_text(f"❌ Не удалось снять копию: {escape(str(e))}")
+        return
+    
+    await status.edit_text(
+        f"✅ <b>Резервная копия готова</b>\n\n"
+        f"📁 <code>{path.name}</code> ({path.stat().st_size / 1024:.0f} КБ)\n"
+        f"Проверка целостности пройдена. Хранятся последние {backups.keep} копий.",
+        parse_mode="HTML"
+    )
+
+
+# === Коды залов ===
+
+@router.message(Command("codes"))
+async def cmd_codes(message: Message):
+    """Коды залов и число отметок по залам в активном дне."""
+    if not is_admin(message.from_user.id):
+        return
+    
+    room_codes = await db.get_day_codes()
+    active_day = await db.get_active_day()
+    by_location = await db.get_location_stats(active_day['day_number']) if active_day else {}
+    
+    text = "🚪 <b>Коды залов</b>\n\n"
+    for row in room_codes:
+        count = ""
+        if active_day and row['day_number'] == active_day['day_number']:
+            count = f" — {by_location.get(row['location'], 0)} чел."
+        text += (
+            f"📅 День {row['day_number']}, {escape(row['location'])}: "
+            f"<code>{escape(row['code'])}</code>{count}\n"
+        )
+    if not room_codes:
+        text += "Кодов залов пока нет.\n"
+    if active_day:
+        text += f"\nПо основному коду Дня {active_day['day_number']}: {by_location.get(None, 0)} чел.\n"
+    text += (
+        "\nДобавить: /addcode &lt;день&gt; &lt;код&gt; &lt;зал&gt;\n"
+        "Удалить: /delcode &lt;код&gt;"
+    )
+    await message.answer(text, parse_mode="HTML")
+
+
+@router.message(Command("addcode"))
+async def cmd_addcode(message: Message, command: CommandObject):
+    """Добавить код зала: /addcode <день> <код> <зал>."""
+    if not is_admin(message.from_user.id):
+        return
+    
+    args = (command.args or "").split(maxsplit=2)
+    if len(args) < 3 or not args[0].isdigit():
+        await message.answer("🚪 Использование: /addcode 2 ЗАЛ-А Большой зал")
+        return
+    day_number, code, location = int(args[0]), args[1], args[2].strip()
+    if len(code) < 3:
+        await message.answer("❌ Код должен содержать минимум 3 символа.")
+        return
+    
+    if not await codes.add(code, day_number, location):
+        await message.answer("❌ Такой код уже используется.")
+        return
+    
+    await message.answer(
+        f"✅ Код <code>{escape(code.upper())}</code> для Дня {day_number} "
+        f"({escape(location)}) добавлен.\n\n"
+        f"Работает, пока День {day_number} открыт.",
+        parse_mode="HTML"
+    )
+
+
+@router.message(Command("delcode"))
+async def cmd_delcode(message: Message, command: CommandObject):
+    """Удалить код зала: /delcode <код>."""
+    if not is_admin(message.from_user.id):
+        return
+    
+    if not command.args:
+        await message.answer("🚪 Использование: /delcode ЗАЛ-А")
+        return
+    
+    if await codes.remove(command.args):
+        await message.answer("✅ Код зала удалён.")
+    else:
+        await message.answer("❌ Такого кода зала нет.")
+
+
 # === Статистика ===
 
 @router.callback_query(F.data == "admin_stats")
@@ -186,8 +322,17 @@ async def show_stats(callback: CallbackQuery):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
+    await callback.message.edit_text(
+        await cached_screen("stats", render_stats),
+        parse_mode="HTML",
+        reply_markup=get_back_to_admin_kb()
+    )
+    await callback.answer()
+
+
+async def render_stats() -> str:
     day_stats = await db.get_day_stats()
-    users = await db.get_all_users()
+    users_count = await db.get_users_count()
     
     if not day_stats:
         stats_text = "📊 Статистика пока пуста"
@@ -197,64 +342,215 @@ async def show_stats(callback: CallbackQuery):
             status = "🟢" if day['is_active'] else "⚪"
             stats_text += f"{status} День {day['day_number']}: {day['attendees']} чел.\n"
     
-    await callback.message.edit_text(
+    return (
         f"{stats_text}\n\n"
-        f"👥 Всего зарегистрировано: {len(users)} чел.",
-        parse_mode="HTML",
-        reply_markup=get_back_to_admin_kb()
+        f"👥 Всего зарегистрировано: {users_count} чел."
     )
-    await callback.answer()
 
 
-@router.callback_query(F.data == "admin_users")
-async def show_users(callback: CallbackQuery):
-    """Показать список участников."""
+@router.callback_query(F.data == "admin_group_stats")
+async def show_group_stats(callback: CallbackQuery):
+    """Показать статистику по группам."""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
-    stats = await db.get_attendance_stats()
+    groups = await db.get_group_stats()
+    
+    if not groups:
+        text = "🎓 Статистика по группам пока пуста"
+    else:
+        text = "🎓 <b>Статистика по группам:</b>\n\n"
+        for i, group in enumerate(groups):
+            days = " · ".join(f"Д{d}: {n}" for d, n in sorted(group['days'].items()))
+            line = (
+                f"<b>{escape(group['group_name'])}</b> — {group['participants']} чел., "
+                f"{group['rate']:.0%}\n"
+                f"   {days or 'нет отметок'}\n"
+            )
+            if len(text) + len(line) > 3900:
+                text += f"\n... и ещё {len(groups) - i} групп (полные данные — в отчёте)"
+                break
+            text += line
     
-    if not stats:
+    try:
         await callback.message.edit_text(
-            "👥 Пока нет зарегистрированных участников.",
-            reply_markup=get_back_to_admin_kb()
+            text,
+            parse_mode="HTML",
+            reply_markup=get_group_stats_kb()
         )
-        await callback.answer()
-        return
+    except TelegramBadRequest:
+        # «Обновить» без новых данных — текст не изменился
+        pass
+    await callback.answer()
+
+
+USERS_PAGE_SIZE = 20
+FIND_LIMIT = 20
+# Группы в меню фильтра; больше — неудобно выбирать кнопками
+MAX_GROUP_BUTTONS = 50
+
+
+async def render_users_page(callback: CallbackQuery, state: FSMContext,
+                            after_id: int | None = None, before_id: int | None = None):
+    """Показать страницу списка участников с учётом фильтра по группе."""
+    data = await state.get_data()
+    group_name = data.get('users_group')
     
-    text = "👥 <b>Список участников:</b>\n\n"
-    for i, user in enumerate(stats[:20], 1):  # Ограничим до 20 для читаемости
-        fio = f"{user['last_name']} {user['first_name']}"
-        if user['patronymic']:
-            fio += f" {user['patronymic']}"
-        days = user['attended_days'] or "0"
-        text += f"{i}. {fio} ({user['group_name']}) - {user['total_days']} дн.\n"
+    # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = await db.get_users_page(
+        after_id=after_id, before_id=before_id,
+        group_name=group_name, limit=USERS_PAGE_SIZE + 1
+    )
+    has_more = len(rows) > USERS_PAGE_SIZE
+    if before_id is not None:
+        page = rows[-USERS_PAGE_SIZE:]
+        has_prev, has_next = has_more, True
+    else:
+        page = rows[:USERS_PAGE_SIZE]
+        has_prev, has_next = after_id is not None, has_more
     
-    if len(stats) > 20:
-        text += f"\n... и ещё {len(stats) - 20} участников"
+    if not page:
+        text = "👥 Пока нет зарегистрированных участников."
+    else:
+        title = f"👥 <b>Участники группы {escape(group_name)}:</b>" if group_name else "👥 <b>Список участников:</b>"
+        text = f"{title}\n\n"
+        for user in page:
+            fio = f"{user['last_name']} {user['first_name']}"
+            if user['patronymic']:
+                fio += f" {user['patronymic']}"
+            text += f"• {escape(fio)} ({escape(user['group_name'])}) - {user['total_days']} дн.\n"
     
     await callback.message.edit_text(
         text,
         parse_mode="HTML",
-        reply_markup=get_back_to_admin_kb()
+        reply_markup=get_users_page_kb(
+            prev_id=page[0]['user_id'] if page and has_prev else None,
+            next_id=page[-1]['user_id'] if page and has_next else None,
+            filtered=group_name is not None
+        )
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "admin_users")
+async def show_users(callback: CallbackQuery, state: FSMContext):
+    """Показать список участников (первая страница)."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    await render_users_page(callback, state)
+
+
+@router.callback_query(F.data.startswith("users_next_") | F.data.startswith("users_prev_"))
+async def show_users_page(callback: CallbackQuery, state: FSMContext):
+    """Перелистывание списка участников."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    user_id = int(callback.data.split("_")[-1])
+    if callback.data.startswith("users_next_"):
+        await render_users_page(callback, state, after_id=user_id)
+    else:
+        await render_users_page(callback, state, before_id=user_id)
+
+
+@router.callback_query(F.data == "users_groups")
+async def select_users_group(callback: CallbackQuery, state: FSMContext):
+    """Выбор группы для фильтра."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    groups = (await db.get_groups())[:MAX_GROUP_BUTTONS]
+    # Названия групп не влезают в callback_data, поэтому храним список в FSM
+    await state.update_data(users_groups=[g['group_name'] for g in groups])
+    
+    await callback.message.edit_text(
+        "🔎 <b>Выберите группу:</b>",
+        parse_mode="HTML",
+        reply_markup=get_groups_kb(groups)
     )
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith("users_group_"))
+async def filter_users_by_group(callback: CallbackQuery, state: FSMContext):
+    """Список участников выбранной группы."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    index = int(callback.data.split("_")[-1])
+    groups = (await state.get_data()).get('users_groups', [])
+    if index >= len(groups):
+        await callback.answer("❌ Список групп устарел, выберите снова", show_alert=True)
+        return
+    
+    await state.update_data(users_group=groups[index])
+    await render_users_page(callback, state)
+
+
+@router.callback_query(F.data == "users_all")
+async def reset_users_filter(callback: CallbackQuery, state: FSMContext):
+    """Сбросить фильтр по группе."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    await state.update_data(users_group=None)
+    await render_users_page(callback, state)
+
+
+@router.message(Command("find"))
+async def cmd_find(message: Message, command: CommandObject):
+    """Поиск участника: /find <фамилия, имя или группа>."""
+    if not is_admin(message.from_user.id):
+        return
+    
+    if not command.args:
+        await message.answer("🔎 Использование: /find Иванов (можно начало слова и несколько слов)")
+        return
+    
+    users = await db.search_users(command.args, limit=FIND_LIMIT)
+    if not users:
+        await message.answer("🔎 Никого не найдено.")
+        return
+    
+    text = "🔎 <b>Найдено:</b>\n\n"
+    for user in users:
+        fio = f"{user['last_name']} {user['first_name']}"
+        if user['patronymic']:
+            fio += f" {user['patronymic']}"
+        attended_days = set(
+            map(int, user['attended_days'].split(','))
+            if user['attended_days'] else []
+        )
+        days_visual = "".join("✅" if d in attended_days else "⬜" for d in range(1, 6))
+        text += (
+            f"<b>{escape(fio)}</b> ({escape(user['group_name'])})\n"
+            f"   🆔 <code>{user['user_id']}</code>  {days_visual}\n"
+        )
+    if len(users) == FIND_LIMIT:
+        text += f"\nПоказаны первые {FIND_LIMIT}, уточните запрос."
+    
+    await message.answer(text, parse_mode="HTML")
+
+
 # === Полный отчёт ===
 
 @router.callback_query(F.data == "admin_full_report")
 async def full_report(callback: CallbackQuery, bot: Bot):
-    """Полный отчёт со всеми участниками и их посещениями."""
+    """Полный отчёт: сводка по дням и файл со всеми участниками."""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
-    stats = await db.get_attendance_stats()
-    day_stats = await db.get_day_stats()
+    report = await cached_screen("report", render_report)
     
-    if not stats:
+    if report is None:
         await callback.message.edit_text(
             "📋 Пока нет данных для отчёта.",
             reply_markup=get_back_to_admin_kb()
@@ -262,81 +558,73 @@ async def full_report(callback: CallbackQuery, bot: Bot):
         await callback.answer()
         return
     
-    # Формируем текстовый отчёт
+    await callback.message.edit_text(
+        report,
+        parse_mode="HTML",
+        reply_markup=get_report_kb(xlsx=XLSX_AVAILABLE)
+    )
+    await callback.answer()
+    
+    await send_attendance_file(bot, callback.from_user.id, "csv")
+
+
+async def render_report() -> str | None:
+    """Сводка полного отчёта (None — если участников нет)."""
+    users_count = await db.get_users_count()
+    if not users_count:
+        return None
+    day_stats = await db.get_day_stats()
+    
+    # Короткая сводка, подробности — в файле
     report = "📋 <b>ПОЛНЫЙ ОТЧЁТ</b>\n"
     report += "━━━━━━━━━━━━━━━━━━━━\n\n"
     
-    # Статистика по дням
     report += "📊 <b>Статистика по дням:</b>\n"
     for day in day_stats:
         status = "🟢" if day['is_active'] else "⚪"
         report += f"  {status} День {day['day_number']}: {day['attendees']} чел.\n"
     report += "\n"
     
-    # Таблица участников
-    report += "👥 <b>Участники:</b>\n\n"
-    
-    for i, user in enumerate(stats, 1):
-        fio = f"{user['last_name']} {user['first_name']}"
-        if user['patronymic']:
-            fio += f" {user['patronymic']}"
-        
-        # Формируем визуализацию посещений
-        attended_days = set(
-            map(int, user['attended_days'].split(',')) 
-            if user['attended_days'] else []
-        )
-        days_visual = ""
-        for d in range(1, 6):
-            days_visual += "✅" if d in attended_days else "⬜"
-        
-        report += f"<b>{i}. {fio}</b>\n"
-        report += f"   📚 {user['group_name']}\n"
-        report += f"   {days_visual} ({user['total_days']}/5)\n\n"
-    
     report += f"━━━━━━━━━━━━━━━━━━━━\n"
-    report += f"📈 <b>Итого: {len(stats)} участников</b>"
+    report += f"📈 <b>Итого: {users_count} участников</b>\n\n"
+    report += "📎 Список участников — в файле ниже."
+    return report
+
+
+@router.callback_query(F.data == "admin_report_xlsx")
+async def full_report_xlsx(callback: CallbackQuery, bot: Bot):
+    """Отчёт в формате XLSX."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
     
-    # Если отчёт слишком длинный, разбиваем на части
-    if len(report) > 4000:
-        # Отправляем новым сообщением, т.к. edit не поддерживает длинные тексты
-        await callback.message.edit_text(
-            "📋 Отчёт слишком большой, отправляю отдельными сообщениями...",
-            reply_markup=None
-        )
-        
-        # Разбиваем на части по 4000 символов
-        chunks = []
-        current_chunk = ""
-        for line in report.split('\n'):
-            if len(current_chunk) + len(line) + 1 > 4000:
-                chunks.append(current_chunk)
-                current_chunk = line + '\n'
-            else:
-                current_chunk += line + '\n'
-        if current_chunk:
-            chunks.append(current_chunk)
-        
-        for chunk in chunks:
-            await bot.send_message(
-                callback.from_user.id,
-                chunk,
-                parse_mode="HTML"
-            )
-        
-        await bot.send_message(
-            callback.from_user.id,
-            "✅ Отчёт отправлен!",
-            reply_markup=get_back_to_admin_kb()
-        )
-    else:
-        await callback.message.edit_text(
-            report,
-            parse_mode="HTML",
-            reply_markup=get_back_to_admin_kb()
-        )
+    await callback.answer("⏳ Формирую XLSX...")
+    await send_attendance_file(bot, callback.from_user.id, "xlsx")
+
+
+# Формат -> (версия данных, file_id уже загруженного в Telegram файла)
+_report_files: dict[str, tuple[int, str]] = {}
+
+
+async def send_attendance_file(bot: Bot, chat_id: int, fmt: str):
+    """Сформировать файл посещаемости в фоне и отправить одним документом."""
+    version = db.get_data_version()
+    cached = _report_files.get(fmt)
+    if cached and cached[0] == version:
+        # Данные не менялись — пересылаем тот же файл без выгрузки
+        await bot.send_document(chat_id, document=cached[1], caption="📋 Посещаемость участников")
+        return
     
-    await callback.answer()
+    path = await export_attendance(fmt)
+    try:
+        sent = await bot.send_document(
+            chat_id,
+            document=FSInputFile(path, filename=f"attendance.{fmt}"),
+            caption="📋 Посещаемость участников"
+        )
+    finally:
+        path.unlink(missing_ok=True)
+    _report_files[fmt] = (version, sent.document.file_id)
 
 
 # === Генерация QR-кодов ===
@@ -360,7 +648,11 @@ async def qr_codes_menu(callback: CallbackQuery):
     
     days_info = ""
     for day in days:
-        days_info += f"📅 День {day['day_number']} — код: <code>{day['code']}</code>\n"
+        if rotation.is_rotating(day['day_number']):
+            # Статичный код такого дня не принимается — печатать его незачем
+            days_info += f"📅 День {day['day_number']} — 🔄 ротация, QR только на экране\n"
+        else:
+            days_info += f"📅 День {day['day_number']} — код: <code>{day['code']}</code>\n"
     
     await callback.message.edit_text(
         f"🔲 <b>Генерация QR-кодов</b>\n\n"
@@ -388,30 +680,67 @@ async def generate_qr_for_day(callback: CallbackQuery, bot: Bot):
         await callback.answer("❌ День не найден. Сначала создайте его.", show_alert=True)
         return
     
+    if rotation.is_rotating(day_number):
+        await callback.message.edit_text(
+            f"🔄 <b>Для Дня {day_number} включена ротация</b>\n\n"
+            f"Статичный QR-код этого дня не принимается. Откройте "
+            f"<a href=\"{escape(rotation.display_url(day_number))}\">экран с QR</a> "
+            f"на проекторе или мониторе.",
+            parse_mode="HTML",
+            disable_web_page_preview=True,
+            reply_markup=get_back_to_admin_kb()
+        )
+        await callback.answer()
+        return
+    
     await callback.message.edit_text(
         f"⏳ Генерирую QR-код для Дня {day_number}...",
         reply_markup=None
     )
     
-    # Генерируем QR
-    qr_buffer = generate_qr_code(day['code'], day_number)
-    
-    # Отправляем изображение
-    photo = BufferedInputFile(
-        qr_buffer.read(),
-        filename=f"qr_day_{day_number}.png"
+    caption = (
+        f"🔲 <b>QR-код для Дня {day_number}</b>\n\n"
+        f"📝 Код: <code>{day['code']}</code>\n\n"
+        f"Распечатайте этот QR-код и покажите участникам для сканирования."
     )
     
-    await bot.send_photo(
-        callback.from_user.id,
-        photo=photo,
-        caption=(
-            f"🔲 <b>QR-код для Дня {day_number}</b>\n\n"
-            f"📝 Код: <code>{day['code']}</code>\n\n"
-            f"Распечатайте этот QR-код и покажите участникам для сканирования."
-        ),
-        parse_mode="HTML"
-    )
+    # Уже отправляли этот код — пересылаем по file_id без рендера и загрузки
+    file_id = await db.get_qr_file_id(day_number, day['code'], DEFAULT_STYLE)
+    sent = False
+    if file_id:
+        try:
+            await bot.send_photo(
+                callback.from_user.id, photo=file_id, caption=caption, parse_mode="HTML"
+            )
+            sent = True
+        except TelegramBadRequest:
+            # file_id устарел — забываем и загружаем заново
+            await db.save_qr_file_id(day_number, day['code'], DEFAULT_STYLE, None)
+    
+    if not sent:
+        png = qr_cache.get(day_number, day['code'])
+        if png is None:
+            try:
+                png = await generate_qr_code_async(day['code'], day_number)
+            except QRQueueFull:
+                await bot.send_message(
+                    callback.from_user.id,
+                    "⏳ Сейчас генерируется слишком много QR-кодов, попробуйте через минуту.",
+                    reply_markup=get_back_to_admin_kb()
+                )
+                await callback.answer()
+                return
+            qr_cache.put(day_number, day['code'], png)
+        
+        message = await bot.send_photo(
+            callback.from_user.id,
+            photo=BufferedInputFile(png, filename=f"qr_day_{day_number}.png"),
+            caption=caption,
+            parse_mode="HTML"
+        )
+        await db.save_qr_file_id(
+            day_number, day['code'], DEFAULT_STYLE, message.photo[-1].file_id
+        )
     
     await bot.send_message(
         callback.from_user.id,
@@ -421,6 +750,152 @@ async def generate_qr_for_day(callback: CallbackQuery, bot: Bot):
     await callback.answer()
 
 
+# (коды всех дней, file_id) последнего отправленного PDF
+_qr_pack: tuple[tuple, str] | None = None
+
+
+@router.callback_query(F.data == "qr_all")
+async def generate_qr_pack(callback: CallbackQuery, bot: Bot):
+    """Все QR-коды одним PDF для печати."""
+    global _qr_pack
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    all_days = await db.get_all_days()
+    if not all_days:
+        await callback.answer("❌ Сначала создайте хотя бы один день.", show_alert=True)
+        return
+    
+    # Статичные коды дней с ротацией не принимаются — в PDF их не кладём
+    days = [day for day in all_days if not rotation.is_rotating(day['day_number'])]
+    skipped = [day['day_number'] for day in all_days if rotation.is_rotating(day['day_number'])]
+    if not days:
+        await callback.answer(
+            "🔄 Для всех дней включена ротация: QR показывается только на экране.",
+            show_alert=True
+        )
+        return
+    
+    await callback.answer("⏳ Готовлю PDF...")
+    pack_key = tuple((day['day_number'], day['code']) for day in days)
+    caption = "🔲 <b>QR-коды всех дней</b>\n\nПо одному дню на страницу, формат A4."
+    if skipped:
+        caption += (
+            f"\n\n🔄 Без дней с ротацией ({', '.join(map(str, skipped))}): "
+            f"их QR — только на экране, см. «Ротация QR-кодов»."
+        )
+    
+    # Коды не менялись — пересылаем готовый файл
+    if _qr_pack and _qr_pack[0] == pack_key:
+        try:
+            await bot.send_document(
+                callback.from_user.id,
+                document=_qr_pack[1],
+                caption=caption,
+                parse_mode="HTML",
+                reply_markup=get_back_to_admin_kb()
+            )
+            return
+        except TelegramBadRequest:
+            _qr_pack = None
+    
+    # Рендерим параллельно только те дни, которых нет в кэше
+    pngs = {day['day_number']: qr_cache.get(day['day_number'], day['code']) for day in days}
+    missing = [day for day in days if pngs[day['day_number']] is None]
+    if missing:
+        try:
+            rendered = await generate_qr_codes_bulk(
+                [(day['code'], day['day_number']) for day in missing]
+            )
+        except QRQueueFull:
+            await bot.send_message(
+                callback.from_user.id,
+                "⏳ Сейчас генерируется слишком много QR-кодов, попробуйте через минуту.",
+                reply_markup=get_back_to_admin_kb()
+            )
+            return
+        for day, png in zip(missing, rendered):
+            qr_cache.put(day['day_number'], day['code'], png)
+            pngs[day['day_number']] = png
+    
+    pdf = await asyncio.to_thread(
+        build_qr_pdf,
+        [(day['day_number'], day['code'], pngs[day['day_number']]) for day in days]
+    )
+    message = await bot.send_document(
+        callback.from_user.id,
+        document=BufferedInputFile(pdf, filename="qr_codes.pdf"),
+        caption=caption,
+        parse_mode="HTML",
+        reply_markup=get_back_to_admin_kb()
+    )
+    _qr_pack = (pack_key, message.document.file_id)
+
+
+# === Ротируемые QR-коды ===
+
+async def render_qr_rotation() -> tuple[str, list[int]]:
+    days = [day['day_number'] for day in await db.get_all_days()]
+    lines = []
+    for day_number in days:
+        if rotation.is_rotating(day_number):
+            lines.append(
+                f"🔄 День {day_number}: <a href=\"{escape(rotation.display_url(day_number))}\">экран с QR</a>"
+            )
+    links = "\n".join(lines) or "Ротация ни для одного дня не включена."
+    text = (
+        f"🔄 <b>Ротация QR-кодов</b>\n\n"
+        f"QR-код на экране меняется каждые {rotation.interval} с, "
+        f"сфотографированный код быстро перестаёт работать. "
+        f"Статичный код дня для таких дней не принимается.\n\n"
+        f"{links}\n\n"
+        f"Нажмите на день, чтобы включить или выключить ротацию:"
+    )
+    return text, days
+
+
+@router.callback_query(F.data == "qr_rotation")
+async def qr_rotation_menu(callback: CallbackQuery):
+    """Меню ротации QR-кодов."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    text, days = await render_qr_rotation()
+    await callback.message.edit_text(
+        text,
+        parse_mode="HTML",
+        disable_web_page_preview=True,
+        reply_markup=get_qr_rotation_kb(days, {d for d in days if rotation.is_rotating(d)})
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("qr_rot_"))
+async def toggle_qr_rotation(callback: CallbackQuery):
+    """Включить/выключить ротацию для дня."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    day_number = int(callback.data.split("_")[-1])
+    enabled = not rotation.is_rotating(day_number)
+    await rotation.set_rotating(day_number, enabled)
+    
+    text, days = await render_qr_rotation()
+    await callback.message.edit_text(
+        text,
+        parse_mode="HTML",
+        disable_web_page_preview=True,
+        reply_markup=get_qr_rotation_kb(days, {d for d in days if rotation.is_rotating(d)})
+    )
+    await callback.answer(
+        f"🔄 Ротация для Дня {day_number} включена" if enabled
+        else f"Ротация для Дня {day_number} выключена"
+    )
+
+
 # === Рассылка ===
 
 @router.callback_query(F.data == "admin_broadcast")
@@ -430,11 +905,11 @@ async def broadcast_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
-    users = await db.get_all_users()
+    users_count = await db.get_users_count()
     
     await callback.message.edit_text(
         f"📨 <b>Рассылка</b>\n\n"
-        f"Получателей: {len(users)} чел.\n\n"
+        f"Получателей: {users_count} чел.\n\n"
         f"Введите текст сообщения для рассылки:",
         parse_mode="HTML",
         reply_markup=get_cancel_broadcast_kb()
@@ -452,14 +927,8 @@ async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
     
     await state.clear()
     
-    active_day = await db.get_active_day()
-    status = f"🟢 Активен День {active_day['day_number']} (код: {active_day['code']})" if active_day else "🔴 Нет активного дня"
-    users = await db.get_all_users()
-    
     await callback.message.edit_text(
-        f"🔧 <b>Админ-панель</b>\n\n"
-        f"📊 Всего участников: {len(users)}\n"
-        f"📅 Статус: {status}",
+        await cached_screen("panel", render_admin_panel),
         parse_mode="HTML",
         reply_markup=get_admin_menu()
     )
@@ -474,13 +943,13 @@ async def process_broadcast_message(message: Message, state: FSMContext):
     
     await state.update_data(broadcast_text=message.text)
     
-    users = await db.get_all_users()
+    users_count = await db.get_users_count()
     
     await message.answer(
         f"📨 <b>Превью рассылки:</b>\n\n"
         f"{message.text}\n\n"
         f"━━━━━━━━━━━━━━━\n"
-        f"Получателей: {len(users)} чел.\n\n"
+        f"Получателей: {users_count} чел.\n\n"
         f"Отправить?",
         parse_mode="HTML",
         reply_markup=get_confirm_broadcast_kb()
@@ -504,40 +973,75 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot
     
     await state.clear()
     
-    user_ids = await db.get_all_user_ids()
+    await callback.message.edit_text("⏳ Готовлю рассылку...", reply_markup=None)
+    
+    # Рассылка идёт в фоне, обработчик сразу освобождается
+    job_id, total = await broadcasts.start(
+        bot, text, callback.message.chat.id, callback.message.message_id
+    )
     
     await callback.message.edit_text(
         f"⏳ Отправка рассылки...\n\n"
-        f"Прогресс: 0/{len(user_ids)}",
-        reply_markup=None
+        f"Получателей: {total}",
+        reply_markup=get_broadcast_control_kb(job_id)
     )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("bc_pause_"))
+async def pause_broadcast(callback: CallbackQuery):
+    """Пауза рассылки."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
     
-    sent = 0
-    failed = 0
-    
-    for i, user_id in enumerate(user_ids):
-        try:
-            await bot.send_message(user_id, text)
-            sent += 1
-        except Exception:
-            failed += 1
-        
-        # Обновляем прогресс каждые 10 сообщений
-        if (i + 1) % 10 == 0:
-            await callback.message.edit_text(
-                f"⏳ Отправка рассылки...\n\n"
-                f"Прогресс: {i + 1}/{len(user_ids)}"
-            )
-        
-        # Небольшая задержка для избежания флуда
-        await asyncio.sleep(0.05)
+    job_id = int(callback.data.split("_")[-1])
+    if not await broadcasts.pause(job_id):
+        await callback.answer("❌ Рассылка уже завершена", show_alert=True)
+        return
     
     await callback.message.edit_text(
-        f"✅ <b>Рассылка завершена!</b>\n\n"
-        f"📤 Отправлено: {sent}\n"
-        f"❌ Не доставлено: {failed}",
+        "⏸ <b>Рассылка приостановлена</b>",
         parse_mode="HTML",
-        reply_markup=get_back_to_admin_kb()
+        reply_markup=get_broadcast_control_kb(job_id, paused=True)
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("bc_resume_"))
+async def resume_broadcast(callback: CallbackQuery, bot: Bot):
+    """Продолжение рассылки."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    job_id = int(callback.data.split("_")[-1])
+    if not await broadcasts.resume(bot, job_id):
+        await callback.answer("❌ Рассылка уже завершена", show_alert=True)
+        return
+    
+    await callback.message.edit_text(
+        "⏳ Отправка рассылки...",
+        reply_markup=get_broadcast_control_kb(job_id)
     )
     await callback.answer()
 
+
+@router.callback_query(F.data.startswith("bc_cancel_"))
+async def stop_broadcast(callback: CallbackQuery):
+    """Отмена идущей рассылки."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    job_id = int(callback.data.split("_")[-1])
+    if not await broadcasts.cancel(job_id):
+        await callback.answer("❌ Рассылка уже завершена", show_alert=True)
+        return
+    
+    await callback.message.edit_text(
+        "⏹ <b>Рассылка отменена</b>",
+        parse_mode="HTML",
+        reply_markup=get_back_to_admin_kb()
+    )
+    await callback.answer("Рассылка отменена")
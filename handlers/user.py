@@ -1,4 +1,6 @@
 import json
+from collections import OrderedDict
+
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command, CommandStart
@@ -7,6 +9,7 @@ from aiogram.fsm.state import State, StatesGroup
 
 import database as db
 from keyboards import get_main_menu, get_cancel_kb, get_skip_patronymic_kb
+from codes import codes
 
 router = Router()
 
@@ -31,6 +34,9 @@ async def cmd_start(message: Message, state: FSMContext):
     user = await db.get_user(message.from_user.id)
     
     if user:
+        # Раз пишет — значит, бот больше не заблокирован
+        await db.unmark_blocked(message.from_user.id)
+        
         # Пользователь уже зарегистрирован
         fio = f"{user['last_name']} {user['first_name']}"
         if user['patronymic']:
@@ -158,9 +164,18 @@ async def process_group_name(message: Message, state: FSMContext):
 
 # === Ввод кода дня ===
 
-@router.message(F.text == "📝 Ввести код вручную")
+@router.message(F.text == "📝 Ввести код вручную", flags={"antiflood": True})
 async def enter_code_start(message: Message, state: FSMContext):
     """Начало ввода кода дня."""
+    # Уже отмеченным отвечаем из памяти, без запросов к БД
+    marked_day = await db.checked_in_day(message.from_user.id)
+    if marked_day is not None:
+        await message.answer(
+            f"✅ Вы уже отмечены на День {marked_day}!",
+            reply_markup=get_main_menu()
+        )
+        return
+    
     user = await db.get_user(message.from_user.id)
     if not user:
         await message.answer(
@@ -210,10 +225,12 @@ async def process_code(message: Message, state: FSMContext):
         return
     
     entered_code = message.text.strip().upper()
-    correct_code = active_day['code'].upper()
     
-    if entered_code == correct_code:
-        success = await db.mark_attendance(message.from_user.id, active_day['day_number'])
+    target = codes.check(entered_code, active_day)
+    if target is not None:
+        success = await db.mark_attendance(
+            message.from_user.id, active_day['day_number'], target.location
+        )
         await state.clear()
         
         if success:
@@ -237,24 +254,26 @@ async def process_code(message: Message, state: FSMContext):
 
 # === Статистика ===
 
-@router.message(F.text == "📊 Моя статистика")
-async def show_my_stats(message: Message):
-    """Показать статистику пользователя."""
-    user = await db.get_user(message.from_user.id)
-    if not user:
-        await message.answer(
-            "❌ Вы не зарегистрированы. Используйте /start для регистрации."
-        )
-        return
-    
-    attendance = await db.get_user_attendance(message.from_user.id)
+# Отрендеренные экраны статистики: user_id -> текст.
+# Сбрасывается при новой отметке пользователя (см. db.on_attendance_marked)
+STATS_CACHE_SIZE = 5000
+_stats_cache: OrderedDict[int, str] = OrderedDict()
+
+
+@db.on_attendance_marked
+def invalidate_stats(user_id: int):
+    """Сбросить кэш статистики пользователя."""
+    _stats_cache.pop(user_id, None)
+
+
+def render_stats(user: dict) -> str:
+    """Текст экрана статистики."""
+    attendance = user['attendance']
     
     fio = f"{user['last_name']} {user['first_name']}"
     if user['patronymic']:
         fio += f" {user['patronymic']}"
     
-    days_str = ", ".join([f"День {d}" for d in attendance]) if attendance else "Пока нет отметок"
-    
     # Визуализация посещений
     days_visual = ""
     for day in range(1, 6):
@@ -263,12 +282,39 @@ async def show_my_stats(message: Message):
         else:
             days_visual += f"⬜ День {day}\n"
     
-    await message.answer(
+    return (
         f"📊 <b>Ваша статистика</b>\n\n"
         f"👤 {fio}\n"
         f"📚 Группа: {user['group_name']}\n\n"
         f"<b>Посещения:</b>\n{days_visual}\n"
-        f"📈 Итого: {len(attendance)} из 5 дней",
+        f"📈 Итого: {len(attendance)} из 5 дней"
+    )
+
+
+@router.message(F.text == "📊 Моя статистика", flags={"read_only": True})
+async def show_my_stats(message: Message):
+    """Показать статистику пользователя."""
+    user_id = message.from_user.id
+    text = _stats_cache.get(user_id)
+    
+    if text is None:
+        user = await db.get_user_with_attendance(user_id)
+        if not user:
+            await message.answer(
+                "❌ Вы не зарегистрированы. Используйте /start для регистрации."
+            )
+            return
+        
+        text = render_stats(user)
+        _stats_cache[user_id] = text
+        if len(_stats_cache) > STATS_CACHE_SIZE:
+            _stats_cache.popitem(last=False)
+    else:
+        _stats_cache.move_to_end(user_id)
+    
+    # Отправит AntiFloodMiddleware и закэширует вместе с клавиатурой
+    return message.answer(
+        text,
         parse_mode="HTML",
         reply_markup=get_main_menu()
     )
@@ -279,6 +325,15 @@ async def show_my_stats(message: Message):
 @router.message(F.web_app_data)
 async def process_webapp_data(message: Message):
     """Обработка данных от Mini App (отсканированный QR-код)."""
+    # Повторный скан уже отмеченного — ответ из памяти, без запросов к БД
+    marked_day = await db.checked_in_day(message.from_user.id)
+    if marked_day is not None:
+        await message.answer(
+            f"✅ Вы уже отмечены на День {marked_day}!",
+            reply_markup=get_main_menu()
+        )
+        return
+    
     user = await db.get_user(message.from_user.id)
     if not user:
         await message.answer(
@@ -320,11 +375,12 @@ async def process_webapp_data(message: Message):
         )
         return
     
-    # Проверяем код
-    correct_code = active_day['code'].upper()
-    
-    if code == correct_code:
-        success = await db.mark_attendance(message.from_user.id, active_day['day_number'])
+    # Проверяем код (дня, зала или ротируемый, см. codes.py)
+    target = codes.check(code, active_day)
+    if target is not None:
+        success = await db.mark_attendance(
+            message.from_user.id, active_day['day_number'], target.location
+        )
         
         if success:
             attendance = await db.get_user_attendance(message.from_user.id)
@@ -0,0 +1,189 @@
+"""
+Проверки здоровья для /healthz и /readyz (см. api.py).
+
+/healthz отвечает, пока жив процесс и event loop. Для /readyz
+фоновая задача раз в interval секунд проверяет:
+- запись в БД: пробная запись укладывается в db_max_latency;
+- диспетчер: polling запущен, и getUpdates недавно завершался успешно;
+- Bot API: недавние сетевые и серверные ошибки Telegram.
+
+Запрос к /readyz отдаёт последний результат из кэша и ничего не нагружает,
+так что балансировщик может опрашивать его сколько угодно часто.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramConflictError, TelegramNetworkError, TelegramServerError,
+    TelegramUnauthorizedError
+)
+from aiogram.methods import GetUpdates
+
+import database as db
+from config import HEALTH_INTERVAL, HEALTH_DB_MAX_LATENCY_MS
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, которые говорят о проблеме с ботом, а не с отдельным пользователем
+UNHEALTHY_ERRORS = (
+    TelegramNetworkError, TelegramServerError, TelegramUnauthorizedError,
+    TelegramConflictError
+)
+
+
+class TelegramWatch(BaseRequestMiddleware):
+    """Мидлварь сессии бота: последний успешный getUpdates и ошибки Bot API."""
+
+    def __init__(self, max_errors: int = 100):
+        self.last_poll_ok: float | None = None
+        self.errors: deque[tuple[float, str]] = deque(maxlen=max_errors)
+
+    async def __call__(self, make_request, bot: Bot, method):
+        try:
+            response = await make_request(bot, method)
+        except UNHEALTHY_ERRORS as e:
+            self.errors.append((time.monotonic(), f"{type(e).__name__}: {e}"))
+            raise
+        if isinstance(method, GetUpdates):
+            self.last_poll_ok = time.monotonic()
+        return response
+
+    def recent_errors(self, window: float) -> list[str]:
+        since = time.monotonic() - window
+        return [error for at, error in self.errors if at >= since]
+
+
+class HealthChecker:
+    """Периодические проверки готовности с кэшированным результатом."""
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        db_max_latency: float = 1.0,
+        poll_stale: float = 60.0,
+        error_window: float = 60.0,
+        max_recent_errors: int = 5,
+    ):
+        self.interval = interval
+        self.db_max_latency = db_max_latency
+        self.poll_stale = poll_stale
+        self.error_window = error_window
+        self.max_recent_errors = max_recent_errors
+        self.telegram = TelegramWatch()
+
+        self._dp: Dispatcher | None = None
+        self._polling: asyncio.Task | None = None
+        self._polling_started = 0.0
+        self._task: asyncio.Task | None = None
+        self._db_probe: asyncio.Task | None = None
+        self._db_probe_started = 0.0
+        self._stopping = False
+        self._result: dict = {"ready": False, "checks": {}, "reason": "starting"}
+        self._checked_at = 0.0
+
+    def attach(self, dp: Dispatcher, polling: asyncio.Task) -> None:
+        """Следить за диспетчером и задачей polling."""
+        self._dp = dp
+        self._polling = polling
+        self._polling_started = time.monotonic()
+
+    # === Проверки ===
+
+    async def _check_db(self) -> dict:
+        # Зависшую запись не ждём: отмена не прервёт ожидание блокировки SQLite
+        if self._db_probe is not None and not self._db_probe.done():
+            stuck = time.monotonic() - self._db_probe_started
+            return {"ok": False, "error": f"пробная запись висит {stuck:.1f} с"}
+
+        self._db_probe_started = time.monotonic()
+        self._db_probe = asyncio.create_task(db.probe_write())
+        await asyncio.wait([self._db_probe], timeout=self.db_max_latency)
+        latency = time.monotonic() - self._db_probe_started
+        if not self._db_probe.done():
+            return {"ok": False, "error": f"запись дольше {latency * 1000:.0f} мс"}
+        if self._db_probe.exception() is not None:
+            e = self._db_probe.exception()
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        return {"ok": True, "latency_ms": round(latency * 1000, 1)}
+
+    def _check_dispatcher(self) -> dict:
+        if self._polling is None:
+            return {"ok": False, "error": "polling не запущен"}
+        if self._polling.done():
+            return {"ok": False, "error": "polling остановлен"}
+
+        # До первого ответа getUpdates отсчитываем от запуска polling
+        last_ok = self.telegram.last_poll_ok or self._polling_started
+        since = time.monotonic() - last_ok
+        result = {"ok": since <= self.poll_stale, "last_poll_s": round(since, 1)}
+        stats = getattr(self._dp, "stats", None)
+        if stats is not None:
+            result.update(stats())
+        return result
+
+    def _check_telegram(self) -> dict:
+        errors = self.telegram.recent_errors(self.error_window)
+        result = {"ok": len(errors) < self.max_recent_errors, "recent_errors": len(errors)}
+        if errors:
+            result["last_error"] = errors[-1]
+        return result
+
+    async def probe(self) -> dict:
+        """Выполнить все проверки и обновить кэш."""
+        checks = {
+            "db": await self._check_db(),
+            "dispatcher": self._check_dispatcher(),
+            "telegram": self._check_telegram(),
+        }
+        ready = not self._stopping and all(check["ok"] for check in checks.values())
+        self._result = {"ready": ready, "checks": checks}
+        if self._stopping:
+            self._result["reason"] = "stopping"
+        self._checked_at = time.monotonic()
+        return self._result
+
+    async def _run(self) -> None:
+        was_ready = True
+        while True:
+            try:
+                result = await self.probe()
+                # Пишем в лог только смену состояния
+                if was_ready and not result["ready"]:
+                    logger.warning(f"Сервис не готов: {result['checks']}")
+                elif not was_ready and result["ready"]:
+                    logger.info("Сервис снова готов")
+                was_ready = result["ready"]
+            except Exception:
+                logger.exception("Ошибка проверки готовности")
+            await asyncio.sleep(self.interval)
+
+    # === Результат ===
+
+    def readiness(self) -> dict:
+        """Последний результат проверок (без новых запросов)."""
+        if self._stopping:
+            return {**self._result, "ready": False, "reason": "stopping"}
+        age = time.monotonic() - self._checked_at
+        if self._checked_at and age > self.interval * 3:
+            return {**self._result, "ready": False, "reason": f"проверки не обновлялись {age:.0f} с"}
+        return self._result
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="health-checks")
+
+    async def stop(self) -> None:
+        """Перестать считаться готовым (начало остановки) и остановить проверки."""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+health = HealthChecker(interval=HEALTH_INTERVAL, db_max_latency=HEALTH_DB_MAX_LATENCY_MS / 1000)
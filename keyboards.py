@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton,
@@ -11,8 +13,9 @@ from config import WEBAPP_URL
 
 # === Клавиатуры пользователя ===
 
+@lru_cache(maxsize=1)
 def get_main_menu() -> ReplyKeyboardMarkup:
-    """Главное меню пользователя."""
+    """Главное меню пользователя (не меняется, строим один раз)."""
     builder = ReplyKeyboardBuilder()
     # Кнопка с QR-сканером (Mini App)
     if WEBAPP_URL:
@@ -49,6 +52,7 @@ def get_admin_menu() -> InlineKeyboardMarkup:
     builder.row(InlineKeyboardButton(text="🔒 Закрыть текущий день", callback_data="admin_close_day"))
     builder.row(InlineKeyboardButton(text="🔲 Генерация QR-кодов", callback_data="admin_qr_codes"))
     builder.row(InlineKeyboardButton(text="📊 Статистика по дням", callback_data="admin_stats"))
+    builder.row(InlineKeyboardButton(text="🎓 Статистика по группам", callback_data="admin_group_stats"))
     builder.row(InlineKeyboardButton(text="👥 Список участников", callback_data="admin_users"))
     builder.row(InlineKeyboardButton(text="📋 Полный отчёт", callback_data="admin_full_report"))
     builder.row(InlineKeyboardButton(text="📨 Рассылка", callback_data="admin_broadcast"))
@@ -75,6 +79,55 @@ def get_back_to_admin_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def get_users_page_kb(prev_id: int | None, next_id: int | None,
+                      filtered: bool = False) -> InlineKeyboardMarkup:
+    """Навигация по списку участников."""
+    builder = InlineKeyboardBuilder()
+    nav = []
+    if prev_id is not None:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"users_prev_{prev_id}"))
+    if next_id is not None:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"users_next_{next_id}"))
+    if nav:
+        builder.row(*nav)
+    if filtered:
+        builder.row(InlineKeyboardButton(text="👥 Все группы", callback_data="users_all"))
+    else:
+        builder.row(InlineKeyboardButton(text="🔎 Фильтр по группе", callback_data="users_groups"))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back"))
+    return builder.as_markup()
+
+
+def get_groups_kb(groups: list[dict]) -> InlineKeyboardMarkup:
+    """Выбор группы для фильтра (callback содержит номер группы в списке)."""
+    builder = InlineKeyboardBuilder()
+    for i, group in enumerate(groups):
+        builder.add(InlineKeyboardButton(
+            text=f"{group['group_name']} ({group['users']})",
+            callback_data=f"users_group_{i}"
+        ))
+    builder.adjust(2)
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_users"))
+    return builder.as_markup()
+
+
+def get_report_kb(xlsx: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура под полным отчётом."""
+    builder = InlineKeyboardBuilder()
+    if xlsx:
+        builder.row(InlineKeyboardButton(text="📥 Скачать XLSX", callback_data="admin_report_xlsx"))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back"))
+    return builder.as_markup()
+
+
+def get_group_stats_kb() -> InlineKeyboardMarkup:
+    """Обновление статистики по группам."""
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_group_stats"))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back"))
+    return builder.as_markup()
+
+
 def get_cancel_broadcast_kb() -> InlineKeyboardMarkup:
     """Клавиатура отмены рассылки."""
     builder = InlineKeyboardBuilder()
@@ -92,6 +145,17 @@ def get_confirm_broadcast_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def get_broadcast_control_kb(job_id: int, paused: bool = False) -> InlineKeyboardMarkup:
+    """Управление идущей рассылкой."""
+    builder = InlineKeyboardBuilder()
+    if paused:
+        builder.add(InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"bc_resume_{job_id}"))
+    else:
+        builder.add(InlineKeyboardButton(text="⏸ Пауза", callback_data=f"bc_pause_{job_id}"))
+    builder.add(InlineKeyboardButton(text="⏹ Отменить", callback_data=f"bc_cancel_{job_id}"))
+    return builder.as_markup()
+
+
 def get_qr_day_selection_kb() -> InlineKeyboardMarkup:
     """Выбор дня для генерации QR-кода."""
     builder = InlineKeyboardBuilder()
@@ -101,6 +165,22 @@ def get_qr_day_selection_kb() -> InlineKeyboardMarkup:
             callback_data=f"qr_day_{day}"
         ))
     builder.adjust(3)
+    builder.row(InlineKeyboardButton(text="📦 Все дни одним PDF", callback_data="qr_all"))
+    builder.row(InlineKeyboardButton(text="🔄 Ротация QR-кодов", callback_data="qr_rotation"))
     builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back"))
     return builder.as_markup()
 
+
+def get_qr_rotation_kb(days: list[int], rotating: set[int]) -> InlineKeyboardMarkup:
+    """Включение/выключение ротации QR-кода по дням."""
+    builder = InlineKeyboardBuilder()
+    for day in days:
+        mark = "🔄" if day in rotating else "⬜"
+        builder.add(InlineKeyboardButton(
+            text=f"{mark} День {day}",
+            callback_data=f"qr_rot_{day}"
+        ))
+    builder.adjust(3)
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_qr_codes"))
+    return builder.as_markup()
+
@@ -0,0 +1,120 @@
+"""
+Настройка логирования.
+
+Записи не пишутся в stderr из потока event loop: обработчик кладёт их
+в ограниченную очередь, а вывод делает отдельный поток (QueueListener).
+Если очередь переполнена, запись отбрасывается, а число потерянных
+записей попадает в лог, как только место освободится.
+
+LOG_FORMAT=json включает структурированный вывод — по JSON-объекту
+на строку, с request_id запроса API или апдейта бота.
+"""
+
+import copy
+import json
+import logging
+import queue
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Идентификатор текущего запроса API или апдейта (см. api.py, middlewares.py)
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        rid = getattr(record, "request_id", None)
+        if rid:
+            data["request_id"] = rid
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler, который не блокируется и считает потерянные записи."""
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы и исключение форматируем сразу: пока запись ждёт
+        # в очереди, объекты могут измениться
+        record.request_id = request_id.get()
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # emit вызывается под блокировкой обработчика — счётчики согласованы
+        lost = self.dropped - self._reported
+        if lost:
+            notice = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "Очередь логов переполнена, пропущено записей: %d", (lost,), None
+            )
+            try:
+                self.queue.put_nowait(self.prepare(notice))
+            except queue.Full:
+                pass
+            else:
+                self._reported += lost
+        super().emit(record)
+
+
+_handler: BoundedQueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", queue_size: int = 10000) -> None:
+    """Направить все логи через очередь в поток вывода."""
+    global _handler, _listener
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _handler = BoundedQueueHandler(queue_size)
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(level)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Дописать оставшиеся в очереди записи и остановить поток вывода."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    """Сколько записей отброшено из-за переполнения очереди."""
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,148 @@
+"""
+Мониторинг задержки event loop.
+
+Фоновая корутина засыпает на interval и меряет, насколько позже
+срока она проснулась, — это время, которое loop был занят чем-то
+синхронным (рендер, сборка больших строк, блокирующий ввод-вывод).
+Замеры копятся в гистограмме (см. /metrics в api.py).
+
+Если задержка превысила порог, в лог пишется предупреждение со стеком
+потока loop в момент зависания (его снимает сторожевой поток, пока
+loop занят) и стеками текущих задач.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD_MS
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы, в секундах
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LoopLagMonitor:
+    """Замер задержки event loop с гистограммой и предупреждениями."""
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.1,
+                 warn_every: float = 10.0, max_tasks: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.warn_every = warn_every
+        self.max_tasks = max_tasks
+
+        # counts[i] — замеры не больше BUCKETS[i], последняя корзина — +Inf
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.samples = 0
+        self.max_lag = 0.0
+
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._stall_stack: str | None = None
+        self._last_warning = 0.0
+
+    # === Замеры ===
+
+    def observe(self, lag: float) -> None:
+        self.counts[bisect_left(BUCKETS, lag)] += 1
+        self.total += lag
+        self.samples += 1
+        self.max_lag = max(self.max_lag, lag)
+
+    def histogram(self) -> dict:
+        """Снимок гистограммы: накопительные счётчики по корзинам."""
+        buckets = []
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, float("inf")), self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {
+            "buckets": buckets,
+            "sum": self.total,
+            "count": self.samples,
+            "max": self.max_lag,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            self._heartbeat = started
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - started - self.interval, 0.0)
+            self._heartbeat = time.monotonic()
+            self.observe(lag)
+            if lag >= self.threshold:
+                self._warn(lag)
+            else:
+                self._stall_stack = None
+
+    # === Предупреждения ===
+
+    def _watch(self) -> None:
+        """Сторожевой поток: снимает стек loop, пока тот завис."""
+        while not self._stopped.wait(self.threshold / 2):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled < self.threshold or self._stall_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._stall_stack = "".join(traceback.format_stack(frame))
+
+    def _task_stacks(self) -> str:
+        lines = []
+        tasks = [task for task in asyncio.all_tasks() if task is not self._task]
+        for task in tasks[:self.max_tasks]:
+            stack = task.get_stack(limit=1)
+            where = "—"
+            if stack:
+                code = stack[-1].f_code
+                where = f"{code.co_filename}:{stack[-1].f_lineno} in {code.co_name}"
+            lines.append(f"  {task.get_name()}: {where}")
+        if len(tasks) > self.max_tasks:
+            lines.append(f"  ... и ещё {len(tasks) - self.max_tasks}")
+        return "\n".join(lines)
+
+    def _warn(self, lag: float) -> None:
+        stall_stack, self._stall_stack = self._stall_stack, None
+        now = time.monotonic()
+        if now - self._last_warning < self.warn_every:
+            return
+        self._last_warning = now
+
+        message = f"Event loop был занят {lag * 1000:.0f} мс"
+        if stall_stack:
+            message += f"\nСтек loop во время задержки:\n{stall_stack}"
+        message += f"\nЗадачи:\n{self._task_stacks()}"
+        logger.warning(message)
+
+    # === Запуск ===
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+monitor = LoopLagMonitor(interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD_MS / 1000)
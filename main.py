@@ -1,25 +1,90 @@
 import asyncio
 import logging
+import signal
 
 from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
-from config import BOT_TOKEN, API_PORT
-from database import init_db
+from config import (
+    BOT_TOKEN, API_PORT, UPDATES_CONCURRENCY, UPDATES_QUEUE_LIMIT,
+    FSM_CACHE_SIZE, FSM_STATE_TTL_HOURS, ANTIFLOOD_WINDOW, ANTIFLOOD_REPLY_TTL,
+    SHUTDOWN_TIMEOUT, LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, USE_UVLOOP
+)
+import database as db
 from handlers import user_router, admin_router
 from api import create_app
+from backup import backups
+from broadcast import manager as broadcasts
+from codes import codes
+from qr_generator import shutdown_executor
+from rotating import rotation
+from dispatcher import ConcurrentDispatcher
+from health import health
+from logs import setup_logging, stop_logging
+from loop_monitor import monitor
+from middlewares import AntiFloodMiddleware, RequestIdMiddleware
+from storage import SQLiteStorage
 
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-)
+# Настройка логирования (вывод в отдельном потоке, см. logs.py)
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
 
+async def shutdown(dp: Dispatcher, polling: asyncio.Task, runner: web.AppRunner,
+                   storage: SQLiteStorage, bot: Bot):
+    """
+    Корректная остановка, не дольше SHUTDOWN_TIMEOUT:
+    - API перестаёт принимать запросы и дожидается начатых отметок;
+    - polling останавливается, принятые апдейты дорабатываются;
+    - рассылки дожидаются начатых сообщений и сохраняют прогресс;
+    - начатая резервная копия прерывается (недописанный файл удаляется);
+    - FSM-состояния сбрасываются в БД, WAL переносится в основной файл.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SHUTDOWN_TIMEOUT
+    
+    # Балансировщик сразу перестаёт слать трафик (/readyz -> 503)
+    await health.stop()
+    # Начатая резервная копия прерывается сразу, а не после дренажа апдейтов
+    await backups.stop()
+    
+    async def stop_polling():
+        if polling.done():
+            return
+        try:
+            await dp.stop_polling()
+        except RuntimeError:
+            # Сигнал пришёл раньше, чем polling успел запуститься
+            polling.cancel()
+        await asyncio.wait([polling])
+    
+    steps = [
+        asyncio.create_task(stop_polling()),
+        asyncio.create_task(runner.cleanup()),
+        asyncio.create_task(broadcasts.shutdown(SHUTDOWN_TIMEOUT)),
+    ]
+    _, pending = await asyncio.wait(steps, timeout=SHUTDOWN_TIMEOUT)
+    if pending:
+        logger.warning(f"Остановка не уложилась в {SHUTDOWN_TIMEOUT} с, прерываем")
+        for task in [*pending, polling]:
+            task.cancel()
+        await asyncio.wait([*pending, polling])
+    
+    await monitor.stop()
+    # Повторный flush подхватит то, что записали прерванные обработчики
+    await storage.close()
+    shutdown_executor()
+    try:
+        await db.checkpoint()
+    except Exception:
+        logger.exception("Не удалось выполнить checkpoint БД")
+    await bot.session.close()
+    logger.info(f"Бот остановлен за {SHUTDOWN_TIMEOUT - (deadline - loop.time()):.1f} с")
+
+
 async def main():
     """Точка входа."""
     # Проверяем токен
@@ -27,8 +92,15 @@ async def main():
         logger.error("BOT_TOKEN не указан! Создайте .env файл с токеном.")
         return
     
+    # Следим за задержкой event loop
+    monitor.start()
+    logger.info(f"Event loop: {type(asyncio.get_running_loop()).__module__}")
+    
     # Инициализируем базу данных
-    await init_db()
+    await db.init_db()
+    await db.load_checked_in()
+    await rotation.load()
+    await codes.load()
     logger.info("База данных инициализирована")
     
     # Создаём бота и диспетчер
@@ -36,28 +108,92 @@ async def main():
         token=BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher()
+    # Следим за ошибками Bot API и ответами getUpdates (для /readyz)
+    bot.session.middleware(health.telegram)
+    storage = SQLiteStorage(
+        cache_size=FSM_CACHE_SIZE,
+        ttl=FSM_STATE_TTL_HOURS * 60 * 60
+    )
+    if UPDATES_CONCURRENCY > 0:
+        dp = ConcurrentDispatcher(
+            storage=storage,
+            max_concurrency=UPDATES_CONCURRENCY,
+            max_queued=UPDATES_QUEUE_LIMIT,
+            shutdown_timeout=SHUTDOWN_TIMEOUT
+        )
+        logger.info(f"Параллельная обработка апдейтов: до {UPDATES_CONCURRENCY} одновременно")
+    else:
+        dp = Dispatcher(storage=storage)
+    
+    # request_id апдейта для логов
+    dp.update.outer_middleware(RequestIdMiddleware())
+    
+    # Схлопываем повторные нажатия кнопок
+    antiflood = AntiFloodMiddleware(window=ANTIFLOOD_WINDOW, reply_ttl=ANTIFLOOD_REPLY_TTL)
+    dp.message.middleware(antiflood)
+    dp.callback_query.middleware(antiflood)
+    db.on_attendance_marked(antiflood.invalidate)
     
     # Регистрируем роутеры
     dp.include_router(admin_router)  # Админ роутер первый для приоритета
     dp.include_router(user_router)
     
+    # Продолжаем рассылки, прерванные перезапуском
+    resumed = await broadcasts.resume_unfinished(bot)
+    if resumed:
+        logger.info(f"Продолжено рассылок: {resumed}")
+    
     # Создаём API сервер
     api_app = create_app()
-    runner = web.AppRunner(api_app)
+    runner = web.AppRunner(api_app, shutdown_timeout=SHUTDOWN_TIMEOUT)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", API_PORT)
     await site.start()
     logger.info(f"API сервер запущен на порту {API_PORT}")
     
-    # Запускаем бота
+    # Запускаем бота. SIGTERM/SIGINT обрабатываем сами, чтобы остановить
+    # всё согласованно (см. shutdown), а не только polling
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
     logger.info("Бот запущен!")
+    polling = asyncio.create_task(
+        dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+    )
+    health.attach(dp, polling)
+    health.start()
+    # Резервные копии БД по расписанию (см. backup.py)
+    backups.start()
+    stopping = asyncio.create_task(stop.wait())
     try:
-        await dp.start_polling(bot)
+        await asyncio.wait([polling, stopping], return_when=asyncio.FIRST_COMPLETED)
     finally:
-        await runner.cleanup()
-        await bot.session.close()
+        stopping.cancel()
+        logger.info("Останавливаемся...")
+        await shutdown(dp, polling, runner, storage, bot)
+    
+    # Ошибка polling (если была) — наружу
+    if not polling.cancelled():
+        polling.result()
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """uvloop, если он включён в настройках и установлен, иначе стандартный loop."""
+    if USE_UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("USE_UVLOOP включён, но uvloop не установлен — используем asyncio")
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        with asyncio.Runner(loop_factory=new_event_loop) as runner:
+            runner.run(main())
+    finally:
+        stop_logging()
@@ -0,0 +1,156 @@
+"""
+Мидлвари бота.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.methods import SendMessage
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from logs import request_id
+
+
+@dataclass
+class CachedReply:
+    """Отправленный экран: текст вместе с разметкой и клавиатурой."""
+    at: float
+    text: str
+    parse_mode: Any
+    reply_markup: Any
+
+
+@dataclass
+class FloodState:
+    """Последнее действие пользователя и кэш его экранов."""
+    signature: tuple | None = None
+    seen_at: float = 0.0
+    # имя обработчика -> последний ответ
+    replies: dict[str, CachedReply] = field(default_factory=dict)
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    """
+    Схлопывает повторные нажатия кнопок.
+
+    - для обработчиков с флагом antiflood или read_only одинаковые
+      сообщения/колбэки от пользователя чаще, чем раз в window секунд,
+      отбрасываются — в том числе в состоянии FSM (повторное нажатие
+      «Ввести код вручную», пока бот ждёт код);
+    - для обработчиков с флагом read_only последний ответ отдаётся
+      из кэша в течение reply_ttl секунд, без обращения к БД.
+
+    read_only-обработчик возвращает неотправленный SendMessage
+    (return message.answer(...)): мидлварь отправляет его сама и
+    запоминает текст вместе с клавиатурой. Остальные апдейты, отметки
+    из Mini App и ввод в состоянии FSM (обработчики без флагов, например
+    повтор кода после ошибки) проходят без изменений.
+    """
+
+    def __init__(self, window: float = 1.0, reply_ttl: float = 5.0, max_users: int = 10000):
+        self.window = window
+        self.reply_ttl = reply_ttl
+        self.max_users = max_users
+        self._users: OrderedDict[int, FloodState] = OrderedDict()
+
+    @staticmethod
+    def _signature(event: TelegramObject) -> tuple | None:
+        if isinstance(event, Message):
+            if event.text:
+                return ("text", event.text)
+            return None
+        if isinstance(event, CallbackQuery):
+            return ("callback", event.data)
+        return None
+
+    def _get_state(self, user_id: int) -> FloodState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = FloodState()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def invalidate(self, user_id: int) -> None:
+        """Сбросить кэш экранов пользователя (например, после отметки)."""
+        state = self._users.get(user_id)
+        if state is not None:
+            state.replies.clear()
+
+    def _dedupable(self, event: TelegramObject, data: dict[str, Any]) -> bool:
+        if not (get_flag(data, "antiflood", default=False)
+                or get_flag(data, "read_only", default=False)):
+            return False
+        # Отметки из Mini App не трогаем
+        if isinstance(event, Message) and event.web_app_data:
+            return False
+        return self._signature(event) is not None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        state = self._get_state(user.id)
+
+        if not self._dedupable(event, data):
+            # Любое изменяющее действие может поменять экраны пользователя
+            state.signature = None
+            state.replies.clear()
+            return await handler(event, data)
+
+        now = time.monotonic()
+        signature = self._signature(event)
+
+        # Повторное нажатие — молча пропускаем
+        if state.signature == signature and now - state.seen_at < self.window:
+            if isinstance(event, CallbackQuery):
+                await event.answer()
+            return None
+        state.signature = signature
+        state.seen_at = now
+
+        if not get_flag(data, "read_only", default=False):
+            state.replies.clear()
+            return await handler(event, data)
+
+        name = data["handler"].callback.__name__
+        cached = state.replies.get(name)
+        if cached and now - cached.at < self.reply_ttl and isinstance(event, Message):
+            return await event.answer(
+                cached.text, parse_mode=cached.parse_mode, reply_markup=cached.reply_markup
+            )
+
+        result = await handler(event, data)
+        if isinstance(result, SendMessage):
+            sent = await result
+            state.replies[name] = CachedReply(now, result.text, result.parse_mode, result.reply_markup)
+            return sent
+        return result
+
+
+class RequestIdMiddleware(BaseMiddleware):
+    """Помечает логи обработки апдейта его request_id (см. logs.py)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        rid = f"upd-{event.update_id}" if isinstance(event, Update) else None
+        token = request_id.set(rid)
+        try:
+            return await handler(event, data)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,74 @@
+"""
+Кэш отрендеренных QR-кодов.
+
+Основной путь — повторная отправка по file_id, который Telegram вернул
+при первой загрузке (хранится в БД, см. database.get_qr_file_id).
+Сами картинки (PNG или SVG, в зависимости от стиля) дополнительно лежат
+в LRU-кэше в памяти и на диске — на случай, если file_id больше
+не действителен или картинка нужна в другом месте.
+Код дня входит в ключ, поэтому после смены кода старые картинки просто
+не находятся и со временем вытесняются.
+"""
+
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+
+from config import DATA_DIR
+from qr_generator import DEFAULT_STYLE, file_extension
+
+
+class QRCache:
+    """LRU-кэш отрендеренных QR-кодов: память + диск."""
+
+    def __init__(self, directory: Path, memory_items: int = 16, disk_items: int = 64):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def _path(self, key: tuple) -> Path:
+        day_number, code, style = key
+        digest = hashlib.sha1(code.encode()).hexdigest()[:16]
+        return self.directory / f"day{day_number}_{style}_{digest}.{file_extension(style)}"
+
+    def get(self, day_number: int, code: str, style: str = DEFAULT_STYLE) -> bytes | None:
+        key = (day_number, code, style)
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        path.touch()  # для LRU на диске
+        self._remember(key, data)
+        return data
+
+    def put(self, day_number: int, code: str, data: bytes, style: str = DEFAULT_STYLE) -> None:
+        key = (day_number, code, style)
+        self._remember(key, data)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        self._trim_disk()
+
+    def _remember(self, key: tuple, data: bytes) -> None:
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _trim_disk(self) -> None:
+        files = sorted(self.directory.glob("day*_*.*"), key=lambda p: p.stat().st_mtime)
+        for path in files[:max(len(files) - self.disk_items, 0)]:
+            path.unlink(missing_ok=True)
+
+
+qr_cache = QRCache(DATA_DIR / "qr_cache")
@@ -1,11 +1,57 @@
 """
 Генератор QR-кодов для дней мероприятия.
+
+Рендер занимает заметное время CPU, поэтому из асинхронного кода
+вызывайте generate_qr_code_async: он выполняет рендер в пуле
+потоков или процессов (QR_EXECUTOR) и не блокирует event loop.
+
+Стили (бэкенды) рендера, см. STYLES:
+- "rounded" — PNG с закруглёнными модулями (StyledPilImage), самый медленный;
+- "plain"   — PNG с квадратными модулями, рисуется напрямую из матрицы;
+- "svg"     — векторный SVG: крошечный и масштабируется для печати.
+
+Сравнение скорости и размера: python -m benchmarks.bench_qr_backends
+
+qrcode и PIL импортируются при первом рендере: модуль подключают
+бот и API, а рисуют QR только админка и экран ротации.
 """
 
+import asyncio
 import io
-import qrcode
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from config import QR_EXECUTOR, QR_WORKERS, QR_QUEUE_LIMIT
+
+if TYPE_CHECKING:
+    import qrcode
+
+
+# Цвета из брендбука
+FILL_COLOR = "#2E211B"
+BACK_COLOR = "#EAE0C7"
+BOX_SIZE = 10
+BORDER = 4
+
+
+class QRQueueFull(Exception):
+    """Слишком много QR-кодов ждут рендера."""
+
+
+def _make_qr(code: str) -> "qrcode.QRCode":
+    import qrcode
+    
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=BOX_SIZE,
+        border=BORDER,
+    )
+    # QR содержит только код
+    qr.add_data(code)
+    qr.make(fit=True)
+    return qr
 
 
 def generate_qr_code(code: str, day_number: int) -> io.BytesIO:
@@ -19,23 +65,17 @@ def generate_qr_code(code: str, day_number: int) -> io.BytesIO:
     Returns:
         BytesIO с PNG изображением QR-кода
     """
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
+    from qrcode.image.styledpil import StyledPilImage
+    from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
     
-    # QR содержит только код
-    qr.add_data(code)
-    qr.make(fit=True)
+    qr = _make_qr(code)
     
     # Создаём изображение с закруглёнными модулями
     img = qr.make_image(
         image_factory=StyledPilImage,
         module_drawer=RoundedModuleDrawer(),
-        fill_color="#2E211B",  # Цвет из брендбука
-        back_color="#EAE0C7"   # Фон из брендбука
+        fill_color=FILL_COLOR,
+        back_color=BACK_COLOR
     )
     
     # Сохраняем в BytesIO
@@ -45,3 +85,214 @@ def generate_qr_code(code: str, day_number: int) -> io.BytesIO:
     
     return buffer
 
+
+def _hex_to_rgb(color: str) -> list[int]:
+    return [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+
+
+def render_plain_png(code: str, day_number: int) -> bytes:
+    """PNG с квадратными модулями: пиксель на модуль, затем масштаб без сглаживания."""
+    from PIL import Image
+    
+    matrix = _make_qr(code).get_matrix()
+    size = len(matrix)
+    
+    img = Image.frombytes("P", (size, size), bytes(cell for row in matrix for cell in row))
+    img.putpalette(_hex_to_rgb(BACK_COLOR) + _hex_to_rgb(FILL_COLOR))
+    img = img.resize((size * BOX_SIZE, size * BOX_SIZE), Image.NEAREST)
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_svg(code: str, day_number: int) -> bytes:
+    """Векторный QR: один path, соседние модули строки слиты в прямоугольники."""
+    matrix = _make_qr(code).get_matrix()
+    size = len(matrix)
+    
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f"M{start} {y}h{x - start}v1H{start}z")
+    
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="{BACK_COLOR}"/>'
+        f'<path fill="{FILL_COLOR}" d="{"".join(path)}"/></svg>'
+    ).encode()
+
+
+def render_qr_png(code: str, day_number: int) -> bytes:
+    """PNG-байты QR-кода (функция верхнего уровня — годится для пула процессов)."""
+    return generate_qr_code(code, day_number).getvalue()
+
+
+# Стиль -> (функция рендера, расширение файла)
+STYLES = {
+    "rounded": (render_qr_png, "png"),
+    "plain": (render_plain_png, "png"),
+    "svg": (render_svg, "svg"),
+}
+DEFAULT_STYLE = "rounded"
+
+
+def render_qr(code: str, day_number: int, style: str = DEFAULT_STYLE) -> bytes:
+    """Отрендерить QR-код в выбранном стиле (см. STYLES)."""
+    try:
+        render, _ = STYLES[style]
+    except KeyError:
+        raise ValueError(f"Неизвестный стиль QR-кода: {style}") from None
+    return render(code, day_number)
+
+
+def file_extension(style: str) -> str:
+    """Расширение файла для стиля: png или svg."""
+    return STYLES[style][1]
+
+
+# === Печатный PDF со всеми днями ===
+
+# A4 при 150 dpi
+PAGE_SIZE = (1240, 1754)
+PAGE_DPI = 150
+FONT_PATH = Path(__file__).parent / "webapp" / "fritzquadratacyrillic.ttf"
+
+
+def _load_font(size: int):
+    from PIL import ImageFont
+    
+    try:
+        return ImageFont.truetype(str(FONT_PATH), size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def build_qr_pdf(pages: list[tuple[int, str, bytes]]) -> bytes:
+    """
+    Многостраничный PDF для печати: на каждой странице QR-код дня,
+    подписанный номером дня и кодом.
+    
+    Args:
+        pages: список (номер дня, код, PNG-байты QR)
+    """
+    from PIL import Image, ImageDraw
+    
+    title_font = _load_font(110)
+    code_font = _load_font(60)
+    width, height = PAGE_SIZE
+    qr_size = 900
+    
+    images = []
+    for day_number, code, png in pages:
+        page = Image.new("RGB", PAGE_SIZE, BACK_COLOR)
+        draw = ImageDraw.Draw(page)
+        draw.text((width // 2, 230), f"День {day_number}", font=title_font,
+                  fill=FILL_COLOR, anchor="mm")
+        
+        qr = Image.open(io.BytesIO(png)).convert("RGB")
+        qr = qr.resize((qr_size, qr_size), Image.NEAREST)
+        page.paste(qr, ((width - qr_size) // 2, (height - qr_size) // 2))
+        
+        draw.text((width // 2, height - 300), code, font=code_font,
+                  fill=FILL_COLOR, anchor="mm")
+        images.append(page)
+    
+    buffer = io.BytesIO()
+    images[0].save(
+        buffer, format="PDF", save_all=True,
+        append_images=images[1:], resolution=PAGE_DPI
+    )
+    return buffer.getvalue()
+
+
+# === Пулы для рендера ===
+
+_executors: dict[str, Executor] = {}
+_pending = 0
+
+
+def get_executor(kind: str = QR_EXECUTOR) -> Executor:
+    """Пул для рендера ("thread" или "process"), создаётся при первом обращении."""
+    executor = _executors.get(kind)
+    if executor is None:
+        # concurrent.futures подгружает пулы (и multiprocessing) по первому обращению
+        if kind == "process":
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Не fork: в процессе работают потоки (вывод логов, сторож loop,
+            # пул потоков), и копия чужой захваченной блокировки подвесит воркер
+            executor = ProcessPoolExecutor(
+                max_workers=QR_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+            )
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=QR_WORKERS, thread_name_prefix="qr")
+        _executors[kind] = executor
+    return executor
+
+
+async def _render_many(items: list[tuple[str, int]], kind: str, style: str) -> list[bytes]:
+    global _pending
+    if style not in STYLES:
+        raise ValueError(f"Неизвестный стиль QR-кода: {style}")
+    if _pending + len(items) > QR_QUEUE_LIMIT:
+        raise QRQueueFull()
+    
+    _pending += len(items)
+    try:
+        loop = asyncio.get_running_loop()
+        executor = get_executor(kind)
+        return await asyncio.gather(*(
+            loop.run_in_executor(executor, render_qr, code, day_number, style)
+            for code, day_number in items
+        ))
+    finally:
+        _pending -= len(items)
+
+
+async def generate_qr_code_async(code: str, day_number: int, style: str = DEFAULT_STYLE) -> bytes:
+    """
+    Генерирует QR-код в пуле, не блокируя event loop.
+    
+    Args:
+        style: стиль рендера (см. STYLES)
+    
+    Returns:
+        Байты PNG (или SVG для style="svg")
+    
+    Raises:
+        QRQueueFull: если в очереди уже QR_QUEUE_LIMIT задач
+    """
+    [data] = await _render_many([(code, day_number)], QR_EXECUTOR, style)
+    return data
+
+
+async def generate_qr_codes_bulk(items: list[tuple[str, int]], style: str = DEFAULT_STYLE) -> list[bytes]:
+    """
+    Генерирует несколько QR-кодов параллельно в пуле процессов
+    (рендер упирается в CPU, потоки из-за GIL не ускоряют).
+    
+    Args:
+        items: список (код, номер дня)
+        style: стиль рендера (см. STYLES)
+    
+    Returns:
+        Байты картинок в том же порядке
+    """
+    return await _render_many(items, "process", style)
+
+
+def shutdown_executor():
+    """Остановить пулы рендера (при завершении бота)."""
+    for executor in _executors.values():
+        executor.shutdown(wait=True, cancel_futures=True)
+    _executors.clear()
@@ -0,0 +1,151 @@
+"""
+Ротируемые QR-коды.
+
+Статичный код дня легко сфотографировать и переслать. Для дней с
+включённой ротацией QR содержит токен HMAC(день, окно времени), который
+меняется каждые QR_ROTATION_SECONDS секунд; экран с QR открывается
+по ссылке /display/<день> (см. api.py).
+
+Проверка принимает текущее и предыдущее окно. Токены для них считаются
+один раз при смене окна, так что проверка кода — поиск в словаре,
+без обращения к БД. Кадры — SVG (рендер без PIL, чёткий на любом
+экране) и рендерятся заранее, на окно вперёд.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import time
+
+import database as db
+from config import API_URL, BOT_TOKEN, QR_ROTATION_SECONDS, QR_ROTATION_SECRET
+from qr_generator import generate_qr_code_async
+
+logger = logging.getLogger(__name__)
+
+
+class RotatingCodes:
+    """Токены ротируемых QR-кодов и отрендеренные кадры."""
+
+    def __init__(self, secret: bytes, interval: int = 30):
+        self.secret = secret
+        self.interval = interval
+        self._days: set[int] = set()
+        # Токен -> номер дня для текущего и предыдущего окна
+        self._window: int | None = None
+        self._tokens: dict[str, int] = {}
+        # (день, окно) -> SVG-кадр
+        self._frames: dict[tuple[int, int], bytes] = {}
+        self._rendering: dict[tuple[int, int], asyncio.Task] = {}
+
+    # === Токены ===
+
+    def current_window(self) -> int:
+        return int(time.time()) // self.interval
+
+    def seconds_left(self) -> float:
+        """Сколько секунд осталось до смены кода."""
+        return self.interval - time.time() % self.interval
+
+    def token(self, day_number: int, window: int) -> str:
+        digest = hmac.new(
+            self.secret, f"{day_number}:{window}".encode(), hashlib.sha256
+        ).digest()
+        # 50 бит в base32 — заглавные буквы и цифры, переживают .upper()
+        return f"R{day_number}-{base64.b32encode(digest[:10]).decode()[:10]}"
+
+    def _refresh(self) -> None:
+        window = self.current_window()
+        if window == self._window:
+            return
+        self._tokens = {
+            self.token(day_number, w): day_number
+            for day_number in self._days
+            for w in (window - 1, window)
+        }
+        self._window = window
+
+    def validate(self, code: str) -> int | None:
+        """Номер дня, если код — действующий ротируемый токен."""
+        self._refresh()
+        return self._tokens.get(code)
+
+    def is_rotating(self, day_number: int) -> bool:
+        return day_number in self._days
+
+    # === Включение ===
+
+    async def load(self) -> None:
+        """Загрузить список дней с ротацией из БД (при старте)."""
+        self._days = set(await db.get_rotating_days())
+        self._window = None
+
+    async def set_rotating(self, day_number: int, enabled: bool) -> None:
+        await db.set_day_rotating(day_number, enabled)
+        if enabled:
+            self._days.add(day_number)
+        else:
+            self._days.discard(day_number)
+            for key in [key for key in self._frames if key[0] == day_number]:
+                del self._frames[key]
+        self._window = None
+
+    # === Экран с QR ===
+
+    def display_key(self, day_number: int) -> str:
+        """Ключ доступа к экрану дня (ссылку выдаёт бот админу)."""
+        return hmac.new(
+            self.secret, f"display:{day_number}".encode(), hashlib.sha256
+        ).hexdigest()[:32]
+
+    def check_display_key(self, day_number: int, key: str) -> bool:
+        return hmac.compare_digest(self.display_key(day_number), key)
+
+    def display_url(self, day_number: int) -> str:
+        return f"{API_URL.rstrip('/')}/display/{day_number}?key={self.display_key(day_number)}"
+
+    def _start_render(self, day_number: int, window: int) -> asyncio.Task:
+        key = (day_number, window)
+        task = self._rendering.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                generate_qr_code_async(self.token(day_number, window), day_number, "svg")
+            )
+            self._rendering[key] = task
+            task.add_done_callback(lambda t: self._on_rendered(key, t))
+        return task
+
+    def _on_rendered(self, key: tuple[int, int], task: asyncio.Task) -> None:
+        self._rendering.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"Не удалось отрендерить кадр {key}: {task.exception()!r}")
+            return
+        if key[0] in self._days:
+            self._frames[key] = task.result()
+
+    async def frame(self, day_number: int) -> bytes:
+        """SVG текущего кадра; следующий кадр рендерится заранее."""
+        window = self.current_window()
+        # Старые кадры больше не покажут
+        for key in [key for key in self._frames if key[1] < window]:
+            del self._frames[key]
+
+        svg = self._frames.get((day_number, window))
+        if svg is None:
+            svg = await asyncio.shield(self._start_render(day_number, window))
+        if (day_number, window + 1) not in self._frames:
+            self._start_render(day_number, window + 1)
+        return svg
+
+
+def _default_secret() -> bytes:
+    if QR_ROTATION_SECRET:
+        return QR_ROTATION_SECRET.encode()
+    return hmac.new(b"RotatingQR", (BOT_TOKEN or "").encode(), hashlib.sha256).digest()
+
+
+rotation = RotatingCodes(_default_secret(), QR_ROTATION_SECONDS)
@@ -0,0 +1,196 @@
+"""
+FSM-хранилище на базе SQLite.
+
+Состояния переживают перезапуск бота, а память ограничена:
+- чтения обслуживаются из LRU-кэша фиксированного размера;
+- записи копятся в буфере и сбрасываются в БД одной транзакцией;
+- брошенные состояния удаляются по TTL.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Any
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from config import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StorageRecord:
+    """Запись FSM одного пользователя."""
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_storage с кэшем и отложенной записью."""
+
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        cache_size: int = 10000,
+        ttl: float = 24 * 60 * 60,
+        flush_interval: float = 0.5,
+        cleanup_interval: float = 10 * 60,
+    ):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._cache: OrderedDict[str, StorageRecord] = OrderedDict()
+        self._dirty: dict[str, StorageRecord] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._last_cleanup = 0.0
+
+    # === Кэш ===
+
+    def _is_expired(self, record: StorageRecord) -> bool:
+        return time.time() - record.updated_at > self.ttl
+
+    def _remember(self, key: str, record: StorageRecord) -> None:
+        """Положить запись в LRU-кэш, вытеснив самые старые."""
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key: str) -> StorageRecord:
+        """Получить запись: буфер записи → кэш → БД."""
+        record = self._dirty.get(key)
+        if record is None:
+            record = self._cache.get(key)
+            if record is not None:
+                self._cache.move_to_end(key)
+            else:
+                record = await self._fetch(key)
+                # Пока шёл запрос, запись могли изменить
+                record = self._dirty.get(key, record)
+                self._remember(key, record)
+
+        if self._is_expired(record):
+            return StorageRecord()
+        return record
+
+    async def _fetch(self, key: str) -> StorageRecord:
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?", (key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return StorageRecord(updated_at=time.time())
+        return StorageRecord(
+            state=row[0],
+            data=json.loads(row[1]) if row[1] else {},
+            updated_at=row[2]
+        )
+
+    def _store(self, key: str, record: StorageRecord) -> None:
+        record.updated_at = time.time()
+        self._dirty[key] = record
+        self._remember(key, record)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    # === Сброс в БД ===
+
+    async def _flush_later(self) -> None:
+        """Фоновый сброс, пока в буфере есть изменения."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить FSM-состояния, повторим позже")
+            if not self._dirty:
+                break
+
+    async def flush(self) -> None:
+        """Записать накопленные изменения одной транзакцией."""
+        now = time.time()
+        cleanup = now - self._last_cleanup > self.cleanup_interval
+        if not self._dirty and not cleanup:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        upserts = [
+            (key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at)
+            for key, record in dirty.items() if not record.is_empty
+        ]
+        deletes = [(key,) for key, record in dirty.items() if record.is_empty]
+
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                if upserts:
+                    await db.executemany(
+                        """INSERT INTO fsm_storage (key, state, data, updated_at)
+                           VALUES (?, ?, ?, ?)
+                           ON CONFLICT(key) DO UPDATE SET
+                               state = excluded.state,
+                               data = excluded.data,
+                               updated_at = excluded.updated_at""",
+                        upserts
+                    )
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+                if cleanup:
+                    # Брошенные на середине сценарии
+                    await db.execute(
+                        "DELETE FROM fsm_storage WHERE updated_at < ?", (now - self.ttl,)
+                    )
+                    self._last_cleanup = now
+                await db.commit()
+        except BaseException:
+            # Не теряем изменения: более свежие записи из буфера важнее
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            raise
+
+    # === BaseStorage ===
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        str_key = self.key_builder.build(key)
+        record = await self._load(str_key)
+        self._store(str_key, StorageRecord(
+            state=state.state if isinstance(state, State) else state,
+            data=record.data
+        ))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = await self._load(self.key_builder.build(key))
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        str_key = self.key_builder.build(key)
+        record = await self._load(str_key)
+        self._store(str_key, StorageRecord(state=record.state, data=data.copy()))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await self._load(self.key_builder.build(key))
+        return record.data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flush_task
+        await self.flush()
+        self._cache.clear()